@@ -1,127 +1,903 @@
-import google.generativeai as genai
+import asyncio
+import itertools
 import os
-from typing import List, Dict
+import re
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Dict, Iterator, NamedTuple, Optional, Tuple
 import json
 
-class PFBot:
-    def __init__(self, api_key: str):
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
-        
-        self.model = genai.GenerativeModel('models/gemini-2.0-flash')
-        self.conversation_history: List[Dict] = []
-        self.user_profile = {
-            "pf_contribution": None,
-            "service_years": None,
-            "withdrawal_type": None,
-            "previous_withdrawals": None,
-            "current_balance": None
+import numpy as np
+
+from backends import ModelBackend, create_backend
+from cache import ResponseCache, make_cache_key
+from extractor import PROFILE_EXTRACTOR
+from faq_index import FAQIndex, load_corpus_file
+from memory import ConversationMemory
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+from microbatch import MicroBatcher, parse_batch_answers
+from metrics import COUNT_BUCKETS, METRICS, SIZE_BUCKETS, MetricsRegistry, usage_counts
+from session_store import SessionState, SessionStore
+
+# Bump these whenever the matching prompt changes so stale cached answers are not reused
+CHAT_TEMPLATE_VERSION = "chat-v5"
+ADVICE_TEMPLATE_VERSION = "advice-v3"
+FINAL_TEMPLATE_VERSION = "final-v2"
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_default_cache() -> ResponseCache:
+    """Return the process-wide response cache, creating it on first use."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(
+            max_entries=int(os.getenv("PFBOT_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("PFBOT_CACHE_TTL", "3600")),
+            db_path=os.getenv("PFBOT_CACHE_PATH"),
+        )
+    return _default_cache
+
+
+# Caps outstanding async model calls per process; one semaphore per running event loop
+MAX_CONCURRENT_REQUESTS = int(os.getenv("PFBOT_MAX_CONCURRENCY", "32"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("PFBOT_REQUEST_TIMEOUT", "30"))
+
+_async_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+# Retry, per-attempt deadline and circuit-breaker settings for the model call layer
+MODEL_RETRIES = int(os.getenv("PFBOT_MODEL_RETRIES", "2"))
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("PFBOT_ATTEMPT_TIMEOUT", "15"))
+BREAKER_FAILURES = int(os.getenv("PFBOT_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("PFBOT_BREAKER_RESET", "30"))
+# Background threads that precompute final answers while users answer the last intake question (0 disables)
+SPECULATION_WORKERS = int(os.getenv("PFBOT_SPECULATION_WORKERS", "4"))
+SPECULATION_RESULTS = 1024  # Finished speculative answers held until their session's final turn
+# Advice requests arriving within this many seconds share one model call (0 disables). Off by
+# default: one reply carries every answer, so each user waits for the whole batch to generate.
+ADVICE_BATCH_WINDOW = float(os.getenv("PFBOT_ADVICE_BATCH_WINDOW", "0"))
+ADVICE_BATCH_SIZE = int(os.getenv("PFBOT_ADVICE_BATCH_SIZE", "8"))
+
+
+def _get_async_limiter() -> asyncio.Semaphore:
+    """Return the semaphore shared by every PFBot on the running event loop."""
+    loop = asyncio.get_running_loop()
+    limiter = _async_limiters.get(loop)
+    if limiter is None:
+        limiter = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        _async_limiters[loop] = limiter
+    return limiter
+
+
+# Machine-readable EPFO withdrawal rules, keyed by the withdrawal_type values the
+# profile extractor produces. The Quick Reference cards are generated from this table,
+# and "keywords" help the FAQ index match paraphrased questions.
+WITHDRAWAL_RULES: Dict[str, Dict] = {
+    "unemployment": {
+        "title": "Unemployment",
+        "eligibility": "After 1 month of unemployment.",
+        "min_service_years": 0,
+        "requires_unemployed": True,
+        "min_months_unemployed": 1,
+        "amount": "75% of the PF balance after 1 month. 100% after 2 months.",
+        "condition": "Must have worked for more than 1 month in the previous job.",
+        "keywords": "unemployed lost my job jobless laid off resigned left job not working",
+    },
+    "education": {
+        "title": "Education (Self or Children)",
+        "eligibility": "7 years of contribution to EPF.",
+        "min_service_years": 7,
+        "amount": "50% of the employee's contribution for higher education or children's education after Class 10.",
+        "condition": "Must provide institution certificate for course details.",
+        "keywords": "education study studies college university course fees children kids school higher studies",
+    },
+    "marriage": {
+        "title": "Marriage (Self, Son, Daughter, Sibling)",
+        "eligibility": "7 years of contribution to EPF.",
+        "min_service_years": 7,
+        "amount": "50% of the employee's contribution for marriage expenses.",
+        "condition": "For self, son, daughter, brother, sister only.",
+        "keywords": "marriage wedding married shaadi sister brother son daughter sibling",
+    },
+    "medical_emergency": {
+        "title": "Medical Emergency (Self or Family)",
+        "eligibility": "No minimum service period required.",
+        "min_service_years": 0,
+        "amount": "6 months of basic wages or employee share with interest (whichever is lesser).",
+        "condition": "Applicable for both self and family treatment.",
+        "keywords": "medical hospital treatment surgery illness sick health emergency doctor hospitalisation",
+    },
+    "specially_abled": {
+        "title": "Specially-abled Individuals",
+        "eligibility": "No minimum service period required.",
+        "min_service_years": 0,
+        "amount": "6 months of basic wages or employee share with interest (whichever is lesser) for purchasing equipment for disability.",
+        "condition": "Requires doctor's certificate for eligibility.",
+        "keywords": "disabled disability specially abled handicapped equipment",
+    },
+    "home_loan_repayment": {
+        "title": "Home Loan Repayment",
+        "eligibility": "10 years of contribution to EPF.",
+        "min_service_years": 10,
+        "amount": "36 months of basic wages + DA or total of employee and employer share (whichever is lesser) for paying home loan EMIs.",
+        "condition": "Available only after 10 years of service.",
+        "keywords": "home loan repayment emi housing loan repay",
+    },
+    "house_purchase": {
+        "title": "Purchase of House/Flat or Land Plot",
+        "eligibility": "5 years of contribution to EPF.",
+        "min_service_years": 5,
+        "amount": "24 months of basic wages and DA for site purchase or 36 months of basic wages and DA for house purchase/flat cost/property or total contribution.",
+        "condition": "The amount withdrawn should be the lesser of employee + employer share, property cost, or total contribution.",
+        "keywords": "buy house flat purchase land plot property construct site",
+    },
+    "home_renovation": {
+        "title": "Home Renovation",
+        "eligibility": "5 years of contribution to EPF.",
+        "min_service_years": 5,
+        "amount": "12 months of basic wages and DA, or employee share with interest (whichever is lesser) for home renovation/expansion.",
+        "condition": "Available 2 times: once after 5 years of property completion and again after 10 years.",
+        "keywords": "renovation repair extend expansion alteration home improvement",
+    },
+    "retirement": {
+        "title": "Retirement (Within 1 Year of Retirement)",
+        "eligibility": "54 years of age and within 1 year of retirement/superannuation.",
+        "min_service_years": 0,
+        "min_age": 54,
+        "amount": "90% of the PF balance (whichever is lesser).",
+        "condition": "Can be done within 1 year before retirement.",
+        "keywords": "retirement retire retiring superannuation age 54 58",
+    },
+    "death_of_employee": {
+        "title": "Death of Employee (Nominee)",
+        "eligibility": "No minimum service period required.",
+        "min_service_years": 0,
+        "amount": "Full PF balance transferred to nominee.",
+        "condition": "Form 20 for settlement, Form 10D for monthly pension.",
+        "keywords": "death died deceased nominee family claim passed away",
+    },
+    "other_emergencies": {
+        "title": "Other Emergencies (Natural Calamities, etc.)",
+        "eligibility": "NA",
+        "min_service_years": 0,
+        "amount": "Full Employee share with interest for calamity-related emergencies.",
+        "condition": "Affected by natural disasters like earthquakes, floods.",
+        "keywords": "natural calamity flood earthquake disaster cyclone emergency",
+    },
+}
+
+# Turns that ask about eligibility or the amount are answered by the rule engine once the profile is
+# complete; other follow-ups ("Can I apply online?") go to the FAQ index and the model
+ELIGIBILITY_CUES = re.compile(
+    r"\b(am i eligible|my eligibility|eligible (for|to)|am i allowed|"
+    r"how much (can|could|may|will|do) i|can i (still )?(withdraw|take out|get)|"
+    r"maximum|max (amount|limit))\b",
+    re.IGNORECASE,
+)
+
+QUICK_ANSWERS: Dict[str, str] = {
+    rule["title"]: (
+        f"**{rule['title']}**\n\n- **Eligibility:** {rule['eligibility']}\n"
+        f"- **Amount:** {rule['amount']}\n- **Condition:** {rule['condition']}"
+    )
+    for rule in WITHDRAWAL_RULES.values()
+}
+
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_default_faq_index: Optional[FAQIndex] = None
+
+
+def faq_entries() -> List[Dict]:
+    """FAQ corpus: one entry per withdrawal rule plus the extra EPFO notes file."""
+    entries = [
+        {
+            "id": withdrawal_type,
+            "title": rule["title"],
+            "text": f"{rule['title']} {rule.get('keywords', '')}",
+            "answer": QUICK_ANSWERS[rule["title"]],
         }
-        self.conversation_state = "initial"  # Track conversation flow
-        self.pending_questions = []  # Questions to ask user
-        self.system_prompt = """You are a friendly and knowledgeable Personal Finance (PF) Bot that helps users with their Provident Fund queries. 
-        
-        Your personality:
-        - Be warm, conversational, and empathetic
-        - Use "you" and "your" to make responses personal
-        - Show understanding of their financial situation
-        - Be encouraging and supportive
-        - Use simple, clear language without jargon
-        - Ask intelligent follow-up questions to gather missing information
-        
-        You should:
-        1. Provide accurate and helpful financial advice based on EPFO rules
-        2. Be clear and concise in your responses
-        3. Consider the user's context and previous questions
-        4. Maintain a professional yet friendly tone
-        5. When unsure, ask for clarification rather than making assumptions
-        6. Personalize responses based on their specific situation
-        7. Proactively ask relevant questions to gather missing information
-        
-        Remember to:
-        - Focus on personal finance topics, especially PF withdrawals
-        - Provide practical and actionable advice
-        - Consider different financial situations and contexts
-        - Be mindful of financial regulations and best practices
-        - Always mention specific amounts and eligibility criteria when possible
-        - Ask one question at a time to avoid overwhelming the user
+        for withdrawal_type, rule in WITHDRAWAL_RULES.items()
+    ]
+    corpus_path = os.getenv("PFBOT_FAQ_CORPUS", os.path.join(MODULE_DIR, "epfo_corpus.json"))
+    if os.path.exists(corpus_path):
+        entries.extend(load_corpus_file(corpus_path))
+    return entries
+
+
+def get_default_faq_index() -> FAQIndex:
+    """Return the process-wide FAQ index, loading it from disk (or building it) on first use."""
+    global _default_faq_index
+    if _default_faq_index is None:
+        _default_faq_index = FAQIndex.load_or_build(
+            faq_entries(), os.getenv("PFBOT_FAQ_INDEX", os.path.join(MODULE_DIR, "faq_index.npz"))
+        )
+    return _default_faq_index
+
+
+# Shown above the Quick Reference card served when the model cannot be reached
+FALLBACK_NOTE = (
+    "I can't reach the assistant right now, so here is the general rule for your withdrawal type. "
+    "Please ask again in a moment for a personalized answer."
+)
+
+
+def format_inr(amount: float) -> str:
+    """Format rupees with Indian digit grouping, e.g. ₹12,34,567."""
+    digits = str(int(round(amount)))
+    head, tail = digits[:-3], digits[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    if head:
+        groups.insert(0, head)
+    return "₹" + ",".join(groups + [tail])
+
+
+# Maximum withdrawal per category, from the amount column of WITHDRAWAL_RULES. Each formula
+# takes the calculator's columns ("wages" is basic + DA per month) and works on whole arrays;
+# unknown inputs are NaN and make the limits that depend on them NaN as well.
+AMOUNT_FORMULAS: Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]] = {
+    "unemployment": lambda c: c["balance"] * np.where(c["months_unemployed"] >= 2, 1.0, 0.75),
+    "education": lambda c: 0.5 * c["employee_share"],
+    "marriage": lambda c: 0.5 * c["employee_share"],
+    "medical_emergency": lambda c: np.minimum(6 * c["basic_wage"], c["employee_share"]),
+    "specially_abled": lambda c: np.minimum(6 * c["basic_wage"], c["employee_share"]),
+    "home_loan_repayment": lambda c: np.minimum(36 * c["wages"], c["total_share"]),
+    "house_purchase": lambda c: np.minimum(np.minimum(36 * c["wages"], c["total_share"]), c["property_cost"]),
+    "home_renovation": lambda c: np.minimum(12 * c["wages"], c["employee_share"]),
+    "retirement": lambda c: 0.9 * c["balance"],
+    "death_of_employee": lambda c: c["balance"],
+    "other_emergencies": lambda c: c["employee_share"],
+}
+
+
+class WithdrawalCalculator:
+    """Eligibility masks and withdrawal limits for every category, over one employee or many.
+
+    Input is columnar: a dict of arrays (or lists or scalars), a NumPy structured array or a
+    DataFrame, with any of the columns in INPUTS. Missing columns take their default.
+    """
+
+    # Column name -> default when absent (NaN means unknown)
+    INPUTS = {
+        "basic_wage": np.nan,        # monthly basic wage
+        "da": 0.0,                   # monthly dearness allowance
+        "employee_share": np.nan,    # employee contributions with interest
+        "employer_share": np.nan,    # employer contributions with interest
+        "balance": np.nan,           # total PF balance; defaults to the two shares
+        "service_years": np.nan,
+        "age": np.nan,
+        "unemployed": False,
+        "months_unemployed": np.nan,
+        "property_cost": np.inf,     # caps the house purchase limit when known
+    }
+
+    def __init__(self, rules: Optional[Dict[str, Dict]] = None,
+                 formulas: Optional[Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]]] = None):
+        self.rules = rules if rules is not None else WITHDRAWAL_RULES
+        self.formulas = formulas if formulas is not None else AMOUNT_FORMULAS
+
+    def columns(self, data) -> Dict[str, np.ndarray]:
+        """Normalize the input to equal-length float arrays, deriving wages and total share."""
+        names = data.dtype.names if hasattr(data, "dtype") else data
+        raw = {name: np.asarray(data[name], dtype=np.float64) for name, default in self.INPUTS.items()
+               if name in names}
+        size = np.broadcast_shapes(*(column.shape for column in raw.values())) if raw else ()
+        columns = {name: np.broadcast_to(raw.get(name, np.float64(default)), size).astype(np.float64)
+                   for name, default in self.INPUTS.items()}
+        total = columns["employee_share"] + columns["employer_share"]
+        # With only the balance known, the balance is the best figure for the total share
+        columns["total_share"] = np.where(np.isnan(total), columns["balance"], total)
+        columns["balance"] = np.where(np.isnan(columns["balance"]), total, columns["balance"])
+        columns["wages"] = columns["basic_wage"] + columns["da"]
+        return columns
+
+    def eligibility(self, withdrawal_type: str, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Boolean mask of who meets the category's service, employment, unemployment-period and age rules."""
+        rule = self.rules[withdrawal_type]
+        mask = np.ones(columns["service_years"].shape, dtype=bool)
+        if rule["min_service_years"]:
+            mask &= columns["service_years"] >= rule["min_service_years"]
+        if rule.get("requires_unemployed"):
+            mask &= columns["unemployed"] > 0
+        if rule.get("min_months_unemployed"):
+            mask &= columns["months_unemployed"] >= rule["min_months_unemployed"]
+        if rule.get("min_age"):
+            mask &= columns["age"] >= rule["min_age"]
+        return mask
+
+    def calculate(self, data, categories: Optional[List[str]] = None) -> Dict[str, Dict[str, np.ndarray]]:
+        """Per category: "eligible" mask, "limit" (the formula) and "amount" (limit where eligible, else 0)."""
+        columns = self.columns(data)
+        results = {}
+        for withdrawal_type in categories or self.formulas:
+            eligible = self.eligibility(withdrawal_type, columns)
+            limit = self.formulas[withdrawal_type](columns)
+            results[withdrawal_type] = {
+                "eligible": eligible,
+                "limit": limit,
+                "amount": np.where(eligible, limit, 0.0),
+            }
+        return results
+
+    def calculate_one(self, categories: Optional[List[str]] = None, **inputs) -> Dict[str, Dict]:
+        """Single-employee form of calculate(); unknown limits come back as None."""
+        results = self.calculate(inputs, categories)
+        return {
+            withdrawal_type: {
+                "eligible": bool(result["eligible"]),
+                "limit": None if np.isnan(result["limit"]) else float(result["limit"]),
+            }
+            for withdrawal_type, result in results.items()
+        }
+
+    def estimate(self, user_profile: Dict, withdrawal_type: str) -> Optional[float]:
+        """Withdrawal limit for a chat profile's figures, or None if they are not enough."""
+        if withdrawal_type not in self.formulas:
+            return None
+        inputs = {
+            "basic_wage": user_profile.get("basic_wage"),
+            "balance": user_profile.get("current_balance"),
+            "service_years": user_profile.get("service_years"),
+            "unemployed": user_profile.get("pf_contribution") == "inactive",
+        }
+        inputs = {name: value for name, value in inputs.items() if value is not None}
+        return self.calculate_one([withdrawal_type], **inputs)[withdrawal_type]["limit"]
+
+
+class RuleEngine:
+    """Evaluates withdrawal eligibility from a complete profile without a model call."""
+
+    def __init__(self, rules: Optional[Dict[str, Dict]] = None, calculator: Optional[WithdrawalCalculator] = None):
+        self.rules = rules if rules is not None else WITHDRAWAL_RULES
+        self.calculator = calculator if calculator is not None else WithdrawalCalculator(self.rules)
+
+    def evaluate(self, user_profile: Dict) -> Optional[Dict]:
+        """Return the verdict for the profile, or None if no rule covers it."""
+        rule = self.rules.get(user_profile.get("withdrawal_type"))
+        service_years = user_profile.get("service_years")
+        if rule is None or not isinstance(service_years, int):
+            return None
+
+        reasons = []
+        verdict = "eligible"
+        if service_years < rule["min_service_years"]:
+            verdict = "not_eligible"
+            reasons.append(
+                f"this needs {rule['min_service_years']} years of contribution and you have {service_years}"
+            )
+        if rule.get("requires_unemployed") and user_profile.get("pf_contribution") == "active":
+            verdict = "not_eligible"
+            reasons.append("this is only available once you are no longer employed")
+        if verdict == "eligible" and rule.get("min_months_unemployed"):
+            # How long the user has been out of work is not in the profile, so this is conditional too
+            verdict = "conditional"
+            reasons.append(f"you have been out of work for at least {rule['min_months_unemployed']} month")
+        if verdict == "eligible" and rule.get("min_age"):
+            # Age is not part of the profile, so the best we can say is conditional
+            verdict = "conditional"
+            reasons.append(f"you must be at least {rule['min_age']} years old")
+
+        return {
+            "withdrawal_type": user_profile["withdrawal_type"],
+            "title": rule["title"],
+            "verdict": verdict,
+            "reasons": reasons,
+            "amount": rule["amount"],
+            "condition": rule["condition"],
+            # Exact limit from the user's balance and wages, when the chat has supplied them;
+            # none is quoted to a user who cannot withdraw under this category
+            "estimate": (None if verdict == "not_eligible"
+                         else self.calculator.estimate(user_profile, user_profile["withdrawal_type"])),
+        }
+
+    def format_answer(self, result: Dict, service_years: Optional[int] = None) -> str:
+        """Render a verdict as a short chat answer."""
+        if result["verdict"] == "eligible":
+            headline = f"Good news: you're eligible to withdraw for **{result['title']}**."
+        elif result["verdict"] == "conditional":
+            headline = f"You can withdraw for **{result['title']}** provided {result['reasons'][0]}."
+        else:
+            headline = f"You're not eligible to withdraw for **{result['title']}** yet: {'; '.join(result['reasons'])}."
+
+        lines = [headline, "", f"- **Amount:** {result['amount']}"]
+        if result.get("estimate") is not None:
+            lines.append(f"- **Your maximum, from the figures you shared:** {format_inr(result['estimate'])}")
+        lines.append(f"- **Condition:** {result['condition']}")
+        if service_years is not None:
+            lines.append(f"- **Your service:** {service_years} years")
+        lines += ["", "Do you have any other questions about your withdrawal?"]
+        return "\n".join(lines)
+
+
+# Intake questions in the order they are asked; the first three are required for an answer
+INTAKE_QUESTIONS: Dict[str, str] = {
+    "pf_contribution": "Are you currently employed and actively contributing to your PF?",
+    "service_years": "How long have you been contributing to your PF? (e.g., 5 years, 10 years)",
+    "withdrawal_type": "What's the purpose of your PF withdrawal? (e.g., home loan, medical emergency, education, etc.)",
+    "previous_withdrawals": "Have you withdrawn from your PF before? If yes, under which category?",
+}
+REQUIRED_FIELDS = ("pf_contribution", "service_years", "withdrawal_type")
+# First words of bare replies to the yes/no intake questions
+AFFIRMATIVE_REPLIES = {"yes", "yeah", "yep", "yup", "sure", "correct", "once", "twice"}
+NEGATIVE_REPLIES = {"no", "nope", "nah", "never", "not"}
+
+
+class ConversationFlow:
+    """Intake bookkeeping and templated replies for turns that only collect profile fields.
+
+    Sessions move from "initial" through "collecting" (required fields missing) and
+    "confirming" (required fields known, optional question asked while the model's final answer
+    is precomputed) to "complete".
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Dict]] = None):
+        self.rules = rules if rules is not None else WITHDRAWAL_RULES
+
+    def missing_questions(self, user_profile: Dict) -> List[str]:
+        """Questions for the required fields the profile still lacks, in asking order."""
+        return [INTAKE_QUESTIONS[field] for field in REQUIRED_FIELDS if not user_profile.get(field)]
+
+    def is_intake_answer(self, user_input: str, new_fields: Dict) -> bool:
+        """Whether the message just supplies profile details rather than asking something."""
+        return bool(new_fields) and "?" not in user_input
+
+    def acknowledge(self, new_fields: Dict) -> str:
+        """One sentence confirming the fields this turn supplied."""
+        parts = []
+        if "pf_contribution" in new_fields:
+            parts.append("you're actively contributing to your PF" if new_fields["pf_contribution"] == "active"
+                         else "you're not contributing to your PF right now")
+        if "service_years" in new_fields:
+            parts.append(f"you have {new_fields['service_years']} years of service")
+        if "withdrawal_type" in new_fields:
+            rule = self.rules.get(new_fields["withdrawal_type"])
+            title = rule["title"] if rule else new_fields["withdrawal_type"].replace("_", " ")
+            parts.append(f"you're looking at a withdrawal for **{title.lower()}**")
+        if "current_balance" in new_fields:
+            parts.append(f"your PF balance is {format_inr(new_fields['current_balance'])}")
+        if "basic_wage" in new_fields:
+            parts.append(f"your monthly basic wage is {format_inr(new_fields['basic_wage'])}")
+        if not parts:
+            return "Thanks!"
+        if len(parts) > 1:
+            parts[-1] = "and " + parts[-1]
+        return f"Thanks! I've noted that {', '.join(parts) if len(parts) > 2 else ' '.join(parts)}."
+
+    def reply(self, new_fields: Dict, question: str) -> str:
+        """Templated reply for an intake turn: the acknowledgement, then the next question."""
+        return f"{self.acknowledge(new_fields)}\n\n{question}"
+
+    @staticmethod
+    def _yes_or_no(user_input: str) -> Optional[bool]:
+        match = re.match(r"([a-z]+)\s*(.?)", user_input.strip().lower())
+        word, after = match.groups() if match else ("", "")
+        if word in AFFIRMATIVE_REPLIES:
+            return True
+        # Only a bare "No" (or "No, ...") is an answer; "no idea" and "not sure" are not
+        if word in NEGATIVE_REPLIES and after in ("", ",", ".", "!", ";"):
+            return False
+        return None
+
+    def answer_pending(self, user_input: str, question: str) -> Dict:
+        """Profile fields from a bare reply ("Yes", "No", "5") to the question asked last."""
+        if question == INTAKE_QUESTIONS["pf_contribution"]:
+            answer = self._yes_or_no(user_input)
+            if answer is not None:
+                return {"pf_contribution": "active" if answer else "inactive"}
+        elif question == INTAKE_QUESTIONS["service_years"]:
+            match = re.fullmatch(r"(\d{1,2})\.?", user_input.strip())
+            if match:
+                return {"service_years": int(match.group(1))}
+        return {}
+
+    @classmethod
+    def parse_previous_withdrawals(cls, user_input: str, new_fields: Dict) -> Optional[str]:
+        """Read the answer to the optional previous-withdrawals question, if the message is one."""
+        if "previous_withdrawals" in new_fields:
+            return new_fields["previous_withdrawals"]
+        answer = cls._yes_or_no(user_input)
+        if answer is None:
+            return None
+        return "yes" if answer else "none"
+
+
+SYSTEM_PROMPT = """You are a friendly and knowledgeable Personal Finance (PF) Bot that helps users with their Provident Fund queries.
+
+Your personality:
+- Be warm, conversational, and empathetic
+- Use "you" and "your" to make responses personal
+- Show understanding of their financial situation
+- Be encouraging and supportive
+- Use simple, clear language without jargon
+- Ask intelligent follow-up questions to gather missing information
+
+You should:
+1. Provide accurate and helpful financial advice based on EPFO rules
+2. Be clear and concise in your responses
+3. Consider the user's context and previous questions
+4. Maintain a professional yet friendly tone
+5. When unsure, ask for clarification rather than making assumptions
+6. Personalize responses based on their specific situation
+7. Proactively ask relevant questions to gather missing information
+
+Remember to:
+- Focus on personal finance topics, especially PF withdrawals
+- Provide practical and actionable advice
+- Consider different financial situations and contexts
+- Be mindful of financial regulations and best practices
+- Always mention specific amounts and eligibility criteria when possible
+- Ask one question at a time to avoid overwhelming the user
+"""
+
+# Prompts are split into a static system instruction, sent through the model's
+# system-instruction channel, and a small per-turn template with only the delta. The
+# instructions travel with every request, so they are kept as short as the old inline
+# ones; SYSTEM_PROMPT above is not sent.
+CHAT_INSTRUCTIONS = """You are a friendly and knowledgeable PF withdrawal assistant.
+Each message gives you the user's profile, the conversation so far, whether you have enough
+information for a complete answer, the next question to ask, and the user's new message.
+
+Instructions:
+1. Respond in a warm, conversational tone using "you" and "your"
+2. If you have enough information, provide a complete, personalized answer about their PF withdrawal eligibility
+3. If you need more information, ask the next question naturally in the conversation
+4. Always mention specific EPFO rules and eligibility criteria when possible
+5. Be encouraging and supportive in your tone
+6. Use bullet points or numbered lists for clarity when appropriate
+7. If mentioning amounts, use realistic examples (e.g., "up to ₹2-3 lakhs" for home loan withdrawal)
+8. If asking a question, make it feel natural and conversational, not like an interrogation
+
+Response Guidelines:
+- If you have sufficient info: Provide complete eligibility analysis with specific rules and amounts
+- If missing info: Acknowledge what you understand, then ask the next question naturally
+- Always be helpful and encouraging, regardless of their situation
+
+Remember: You're helping someone with their personal finances, so be empathetic and clear. Make them feel confident about their financial decisions.
+"""
+
+# The request a speculative final answer is generated for
+FINAL_ANSWER_REQUEST = "Based on everything I've told you, am I eligible, and how much can I withdraw?"
+
+CHAT_TURN_TEMPLATE = """User Profile Context:{profile_context}
+
+Previous conversation context:
+{history}
+Has sufficient information for complete answer: {has_sufficient_info}
+Next question to ask: {next_question}
+
+The user is asking: "{user_input}"
+"""
+
+RETRIEVAL_INSTRUCTIONS = """You are a friendly PF withdrawal assistant.
+Each message gives you EPFO reference notes, the user's profile, the next question to ask and
+the user's question. Answer using the reference notes; if they do not cover the question, say
+so briefly and suggest checking with EPFO. Reply in 3-5 warm, clear sentences.
+"""
+
+RETRIEVAL_TURN_TEMPLATE = """Reference notes:
+{snippets}
+
+User Profile Context:{profile_context}
+Next question to ask: {next_question}
+
+The user is asking: "{user_input}"
+"""
+
+ADVICE_INSTRUCTIONS = """Each message gives you a user's intake-form answers.
+Answer in a short, friendly, conversational tone (3-5 sentences max): a clear eligibility
+statement, the EPFO rule that applies, then a nudge to share more details or ask a follow-up.
+If a verified eligibility result is included, base your answer on it.
+"""
+
+ADVICE_BATCH_INSTRUCTIONS = ADVICE_INSTRUCTIONS + """
+Each message holds several intake forms, each under its own request id. Answer every form
+separately, as if it were the only one. Reply with only a JSON array, one object per form:
+[{"id": "<request id>", "answer": "<your answer>"}]
+"""
+
+ADVICE_BATCH_ITEM_TEMPLATE = """### Request id: {request_id}
+{prompt_text}"""
+
+ADVICE_TEMPLATE = """User's Profile:
+- PF Contribution: {pf_contribution}
+- Service Years: {service_years_answer} ({service_years} years if specified)
+- Withdrawal Type: {withdrawal_type}
+- Previous Withdrawals: {previous_withdrawals}
+"""
+
+
+class Prompt(NamedTuple):
+    """A static system instruction plus the per-turn text sent with it."""
+    system: str
+    text: str
+
+
+class PFEngine:
+    """Process-wide half of the bot: model backend, cache, rules, templates and metrics.
+
+    Holds no per-user state, so one instance can be shared by every session and thread.
+    """
+
+    def __init__(self, api_key: str = "", cache: Optional[ResponseCache] = None,
+                 rule_engine: Optional[RuleEngine] = None,
+                 rephrase_rule_answers: bool = False,
+                 backend: Optional[ModelBackend] = None,
+                 metrics: Optional[MetricsRegistry] = None,
+                 faq_index: Optional[FAQIndex] = None,
+                 session_store: Optional[SessionStore] = None,
+                 caller: Optional[ResilientCaller] = None,
+                 advice_batch_window: float = ADVICE_BATCH_WINDOW,
+                 advice_batch_size: int = ADVICE_BATCH_SIZE):
+        # Gemini unless PFBOT_BACKEND selects another backend (e.g. the local stub)
+        self.backend = backend if backend is not None else create_backend(api_key)
+        self.cache = cache if cache is not None else get_default_cache()
+        self.metrics = metrics if metrics is not None else METRICS
+        # Every model call goes through this: coalescing, retries, deadlines and the breaker
+        self.caller = caller if caller is not None else ResilientCaller(
+            CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS),
+            retries=MODEL_RETRIES,
+            attempt_timeout=ATTEMPT_TIMEOUT_SECONDS,
+            metrics=self.metrics,
+        )
+        self.rule_engine = rule_engine if rule_engine is not None else RuleEngine()
+        self.flow = ConversationFlow(self.rule_engine.rules)
+        self.faq_index = faq_index if faq_index is not None else get_default_faq_index()
+        # When set, rule verdicts are handed to the model for phrasing instead of returned as-is
+        self.rephrase_rule_answers = rephrase_rule_answers
+        self.system_prompt = SYSTEM_PROMPT
+        # Sessions with a session_id are written through to this store, if any
+        self.session_store = session_store
+        self._speculations: Dict[str, Future] = {}
+        # Finished speculative answers, kept out of the shared response cache since each is
+        # written from one user's conversation; consumed on use, oldest dropped first
+        self._speculated: "OrderedDict[str, str]" = OrderedDict()
+        self._speculation_pool: Optional[ThreadPoolExecutor] = None
+        self._speculation_lock = threading.Lock()
+        self.advice_batcher: Optional[MicroBatcher] = None
+        if advice_batch_window > 0:
+            self.advice_batcher = MicroBatcher(
+                self._advice_batch, lambda prompt: self.call_model(prompt, "advice").text,
+                window=advice_batch_window, max_size=advice_batch_size, name="advice", metrics=self.metrics,
+            )
+
+    def record_model_call(self, kind: str, prompt: Prompt, elapsed: float, response=None, error: Optional[Exception] = None):
+        """Record timing, prompt size, token usage and errors for one model call."""
+        labels = {"kind": kind}
+        self.metrics.observe("pfbot_model_call_seconds", elapsed, labels)
+        # Per-turn and static-instruction bytes are tracked apart as well as together
+        turn_bytes, system_bytes = len(prompt.text.encode("utf-8")), len(prompt.system.encode("utf-8"))
+        self.metrics.observe("pfbot_prompt_bytes", turn_bytes, labels, buckets=SIZE_BUCKETS)
+        self.metrics.inc("pfbot_static_prefix_bytes_total", system_bytes, labels)
+        # Both parts are sent with every request; this is what a call actually costs
+        self.metrics.observe("pfbot_request_bytes", turn_bytes + system_bytes, labels, buckets=SIZE_BUCKETS)
+        if error is not None:
+            self.metrics.inc("pfbot_errors_total", labels={"kind": kind, "type": type(error).__name__})
+            return
+        prompt_tokens, response_tokens = usage_counts(response)
+        self.metrics.inc("pfbot_prompt_tokens_total", prompt_tokens, labels)
+        self.metrics.inc("pfbot_response_tokens_total", response_tokens, labels)
+
+    def call_model(self, prompt: Prompt, kind: str):
+        """Call the backend through the resilient call layer, recording metrics per attempt.
+
+        Identical prompts already in flight share one call; errors are re-raised.
         """
+        def attempt(timeout: Optional[float]):
+            start = time.perf_counter()
+            try:
+                response = self.backend.generate_content(prompt.text, system_instruction=prompt.system, timeout=timeout)
+            except Exception as e:
+                self.record_model_call(kind, prompt, time.perf_counter() - start, error=e)
+                raise
+            self.record_model_call(kind, prompt, time.perf_counter() - start, response)
+            return response
         
+        return self.caller.call(attempt, key=prompt, timeout=REQUEST_TIMEOUT_SECONDS)
+
+    def _advice_batch(self, items: List[Tuple[str, Prompt]]) -> Dict[str, str]:
+        """Answer several advice prompts with one model call; returns the answers it could parse."""
+        prompt = Prompt(ADVICE_BATCH_INSTRUCTIONS, "\n\n".join(
+            ADVICE_BATCH_ITEM_TEMPLATE.format(request_id=request_id, prompt_text=item.text)
+            for request_id, item in items
+        ))
+        response = self.call_model(prompt, "advice_batch")
+        return parse_batch_answers(response.text, [request_id for request_id, _ in items])
+
+    def speculate(self, key: str, compute: Callable[[], str]):
+        """Run compute() in the background unless its answer is ready or already being computed."""
+        if SPECULATION_WORKERS <= 0:
+            return
+        with self._speculation_lock:
+            if key in self._speculations or key in self._speculated:
+                return
+            if self._speculation_pool is None:
+                self._speculation_pool = ThreadPoolExecutor(SPECULATION_WORKERS, thread_name_prefix="pfbot-speculate")
+            future = self._speculation_pool.submit(compute)
+            self._speculations[key] = future
+        self.metrics.inc("pfbot_speculations_total", labels={"outcome": "started"})
+        future.add_done_callback(lambda done: self._finish_speculation(key, done))
+
+    def _finish_speculation(self, key: str, future: Future):
+        with self._speculation_lock:
+            self._speculations.pop(key, None)
+            if future.exception() is None:
+                self._speculated[key] = future.result()
+                while len(self._speculated) > SPECULATION_RESULTS:
+                    self._speculated.popitem(last=False)
+
+    def speculative_answer(self, key: str, timeout: Optional[float] = None) -> Optional[str]:
+        """The precomputed answer for key, waiting up to timeout if it is still running."""
+        with self._speculation_lock:
+            answer = self._speculated.pop(key, None)
+            future = self._speculations.get(key) if answer is None else None
+        if answer is None:
+            if future is None:
+                return None
+            try:
+                answer = future.result(timeout)
+            except Exception:
+                # Still running past the wait, or failed: the turn takes the regular model path
+                self.metrics.inc("pfbot_speculations_total", labels={"outcome": "missed"})
+                return None
+            with self._speculation_lock:
+                self._speculated.pop(key, None)
+        self.metrics.inc("pfbot_speculations_total", labels={"outcome": "used"})
+        return answer
+
+
+class PFBot:
+    """One conversation: a shared PFEngine plus this user's SessionState."""
+
+    __slots__ = ("engine", "session")
+
+    def __init__(self, api_key: str = "", cache: Optional[ResponseCache] = None,
+                 memory: Optional[ConversationMemory] = None,
+                 rule_engine: Optional[RuleEngine] = None,
+                 rephrase_rule_answers: bool = False,
+                 backend: Optional[ModelBackend] = None,
+                 metrics: Optional[MetricsRegistry] = None,
+                 engine: Optional[PFEngine] = None,
+                 session: Optional[SessionState] = None):
+        # Pass a shared engine to make construction cheap; otherwise this bot gets its own
+        self.engine = engine if engine is not None else PFEngine(
+            api_key, cache, rule_engine, rephrase_rule_answers, backend, metrics
+        )
+        self.session = session if session is not None else SessionState()
+        if memory is not None:
+            self.session.memory = memory
+
+    # Shared components live on the engine
+    backend = property(lambda self: self.engine.backend)
+    cache = property(lambda self: self.engine.cache)
+    metrics = property(lambda self: self.engine.metrics)
+    rule_engine = property(lambda self: self.engine.rule_engine)
+    flow = property(lambda self: self.engine.flow)
+    faq_index = property(lambda self: self.engine.faq_index)
+    rephrase_rule_answers = property(lambda self: self.engine.rephrase_rule_answers)
+    system_prompt = property(lambda self: self.engine.system_prompt)
+
+    # Per-user state lives on the session
+    user_profile = property(lambda self: self.session.user_profile)
+    conversation_history = property(lambda self: self.session.conversation_history)
+    memory = property(lambda self: self.session.memory)
+
+    @property
+    def conversation_state(self) -> str:
+        return self.session.conversation_state
+
+    @conversation_state.setter
+    def conversation_state(self, value: str):
+        self.session.conversation_state = value
+
+    @property
+    def pending_questions(self) -> List[str]:
+        return self.session.pending_questions
+
     def _format_conversation_history(self) -> str:
-        """Format conversation history for context."""
-        formatted_history = ""
-        for message in self.conversation_history:
-            role = message["role"]
-            content = message["content"]
-            formatted_history += f"{role}: {content}\n"
-        return formatted_history
-
-    def _update_user_profile(self, user_input: str):
-        """Update user profile based on conversation context."""
-        # Extract PF contribution status
-        if "contributing" in user_input.lower() or "employed" in user_input.lower():
-            if "yes" in user_input.lower() or "still" in user_input.lower() or "active" in user_input.lower():
-                self.user_profile["pf_contribution"] = "active"
-            elif "no" in user_input.lower() or "not" in user_input.lower() or "unemployed" in user_input.lower():
-                self.user_profile["pf_contribution"] = "inactive"
-        
-        # Extract years of service
-        import re
-        years_match = re.search(r'(\d+)\s*years?', user_input.lower())
-        if years_match:
-            self.user_profile["service_years"] = int(years_match.group(1))
-        
-        # Extract withdrawal type
-        withdrawal_keywords = {
-            "home loan": "home_loan_repayment",
-            "house": "house_purchase",
-            "medical": "medical_emergency",
-            "education": "education",
-            "marriage": "marriage",
-            "unemployment": "unemployment",
-            "renovation": "home_renovation",
-            "retirement": "retirement"
-        }
-        
-        for keyword, withdrawal_type in withdrawal_keywords.items():
-            if keyword in user_input.lower():
-                self.user_profile["withdrawal_type"] = withdrawal_type
-                break
+        """Format conversation history for context within the memory token budget."""
+        return self.memory.render()
+
+    def _add_message(self, role: str, content: str):
+        """Record a message in both the full history and the prompt memory."""
+        message = {"role": role, "content": content}
+        self.conversation_history.append(message)
+        self.memory.add(role, content)
+        if self.engine.session_store is not None and self.session.session_id is not None:
+            self.engine.session_store.append_message(self.session, message)
+
+    def record_message(self, role: str, content: str):
+        """Add a message produced outside get_response (e.g. advice or a quick card)."""
+        self._add_message(role, content)
+
+    def _record_answer(self, source: str):
+        """Count an answer by where it came from (model, cache or rules)."""
+        self.metrics.inc("pfbot_answers_total", labels={"source": source})
+        self.metrics.observe("pfbot_conversation_messages", len(self.conversation_history), buckets=COUNT_BUCKETS)
+
+    def _record_model_call(self, kind: str, prompt: Prompt, elapsed: float, response=None, error: Optional[Exception] = None):
+        """Record timing, prompt size, token usage and errors for one model call."""
+        self.engine.record_model_call(kind, prompt, elapsed, response, error)
+
+    def _call_model(self, prompt: Prompt, kind: str):
+        """Call the model through the engine's resilient call layer; errors are re-raised."""
+        return self.engine.call_model(prompt, kind)
+
+    def _open_stream(self, prompt: Prompt):
+        """Start a streamed call through the call layer and return (first chunk, rest of stream).
+
+        Retries and the breaker cover the call up to its first chunk; later chunks are not retried.
+        """
+        def attempt(timeout: Optional[float]):
+            stream = iter(self.backend.generate_content(
+                prompt.text, stream=True, system_instruction=prompt.system, timeout=timeout
+            ))
+            return next(stream, None), stream
         
-        # Extract previous withdrawals
-        if "withdrawn" in user_input.lower() or "earlier" in user_input.lower():
-            if "no" in user_input.lower() or "never" in user_input.lower():
-                self.user_profile["previous_withdrawals"] = "none"
-            else:
-                self.user_profile["previous_withdrawals"] = "yes"
+        return self.engine.caller.call(attempt, timeout=REQUEST_TIMEOUT_SECONDS)
+
+    def _fallback_answer(self, error: Exception) -> str:
+        """Answer to give when the model call failed or the circuit is open.
+
+        Users whose withdrawal type is known get the static Quick Reference card for it.
+        """
+        rule = WITHDRAWAL_RULES.get(self.user_profile.get("withdrawal_type"))
+        if rule is not None:
+            self._record_answer("fallback")
+            return f"{FALLBACK_NOTE}\n\n{QUICK_ANSWERS[rule['title']]}"
+        if isinstance(error, CircuitOpenError):
+            return "I apologize, but the assistant is temporarily unavailable. Please try again in a moment."
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+            return "I apologize, but the request timed out. Please try again."
+        return f"I apologize, but I encountered an error: {str(error)}"
+
+    def _update_user_profile(self, user_input: str, only: Optional[Tuple[str, ...]] = None) -> Dict:
+        """Update user profile based on conversation context and return the fields found.
+
+        With `only`, every other field the message mentions is ignored.
+        """
+        with self.metrics.timer("pfbot_profile_extraction_seconds"):
+            fields = PROFILE_EXTRACTOR.extract(user_input)
+            if only is not None:
+                fields = {name: value for name, value in fields.items() if name in only}
+            self.user_profile.update(fields)
+        return fields
 
     def _determine_next_question(self) -> str:
         """Determine what question to ask next based on missing information."""
-        missing_info = []
-        
-        if not self.user_profile["pf_contribution"]:
-            missing_info.append("pf_contribution")
-        if not self.user_profile["service_years"]:
-            missing_info.append("service_years")
-        if not self.user_profile["withdrawal_type"]:
-            missing_info.append("withdrawal_type")
-        
-        if missing_info:
-            if "pf_contribution" in missing_info:
-                return "Are you currently employed and actively contributing to your PF?"
-            elif "service_years" in missing_info:
-                return "How long have you been contributing to your PF? (e.g., 5 years, 10 years)"
-            elif "withdrawal_type" in missing_info:
-                return "What's the purpose of your PF withdrawal? (e.g., home loan, medical emergency, education, etc.)"
-        
-        return None
+        missing = self.engine.flow.missing_questions(self.user_profile)
+        return missing[0] if missing else None
 
-    def get_response(self, user_input: str) -> str:
-        # Update user profile based on input
-        self._update_user_profile(user_input)
-        
-        self.conversation_history.append({"role": "user", "content": user_input})
-        
-        # Create a personalized prompt based on user profile
+    def _has_sufficient_info(self) -> bool:
+        """Whether the profile holds everything needed for a complete answer."""
+        return all([
+            self.user_profile["pf_contribution"],
+            self.user_profile["service_years"],
+            self.user_profile["withdrawal_type"]
+        ])
+
+    def _rule_verdict(self) -> Optional[Dict]:
+        """Evaluate the current profile against the withdrawal rules."""
+        if not self._has_sufficient_info():
+            return None
+        return self.rule_engine.evaluate(self.user_profile)
+
+    def _prepare_chat_turn(self, user_input: str, speculation_wait: Optional[float] = REQUEST_TIMEOUT_SECONDS
+                           ) -> Tuple[Prompt, str, Optional[str]]:
+        """Timed wrapper around _build_chat_turn."""
+        with self.metrics.timer("pfbot_prompt_build_seconds", {"kind": "chat"}):
+            return self._build_chat_turn(user_input, speculation_wait)
+
+    def _profile_context(self) -> str:
+        """The known profile fields as prompt lines."""
         profile_context = ""
         if self.user_profile["pf_contribution"]:
             profile_context += f"\n- PF Contribution Status: {self.user_profile['pf_contribution']}"
@@ -131,107 +907,376 @@ class PFBot:
             profile_context += f"\n- Withdrawal Type: {self.user_profile['withdrawal_type']}"
         if self.user_profile["previous_withdrawals"]:
             profile_context += f"\n- Previous Withdrawals: {self.user_profile['previous_withdrawals']}"
+        if self.user_profile["current_balance"]:
+            profile_context += f"\n- Current PF Balance: {format_inr(self.user_profile['current_balance'])}"
+        if self.user_profile["basic_wage"]:
+            profile_context += f"\n- Monthly Basic Wage: {format_inr(self.user_profile['basic_wage'])}"
+        return profile_context
+
+    def _final_answer_key(self, previous_withdrawals: Optional[str] = None) -> str:
+        # The answer draws on this session's history, so the session's token is part of the key,
+        # as are the figures it quotes amounts from and the previous withdrawals it assumed
+        fields = REQUIRED_FIELDS + ("current_balance", "basic_wage")
+        values = {field: self.user_profile[field] for field in fields}
+        values["previous_withdrawals"] = previous_withdrawals or self.user_profile["previous_withdrawals"]
+        return make_cache_key(FINAL_TEMPLATE_VERSION, values, question=self.session.speculation_token or "")
+
+    def _needs_model_for_final_answer(self) -> bool:
+        return self.rephrase_rule_answers or self._rule_verdict() is None
+
+    def _speculate_final_answer(self):
+        """Start the model's full eligibility answer in the background while the user replies.
+
+        It assumes no previous withdrawals, the usual reply; any other reply misses the key.
+        """
+        profile_context = self._profile_context() + "\n- Previous Withdrawals: none"
+        verdict = self._rule_verdict()
+        if verdict:
+            profile_context += f"\n- Verified eligibility result: {self.rule_engine.format_answer(verdict)}"
+        prompt = Prompt(CHAT_INSTRUCTIONS, CHAT_TURN_TEMPLATE.format(
+            profile_context=profile_context,
+            history=self._format_conversation_history(),
+            has_sufficient_info=True,
+            next_question="None",
+            user_input=FINAL_ANSWER_REQUEST,
+        ))
+        self.session.speculation_token = uuid.uuid4().hex
+        key = self._final_answer_key(previous_withdrawals="none")
+        self.engine.speculate(key, lambda: self._call_model(prompt, "speculative").text)
+
+    def _intake_turn(self, user_input: str, new_fields: Dict, was_sufficient: bool) -> Optional[str]:
+        """Answer a turn that only supplies profile details from templates, advancing the flow.
+
+        Returns None when the turn needs the regular rules/FAQ/model path.
+        """
+        flow = self.flow
+        if not flow.is_intake_answer(user_input, new_fields):
+            return None
+        pending = flow.missing_questions(self.user_profile)
+        self.pending_questions[:] = pending
+        if pending:
+            self.conversation_state = "collecting"
+            return flow.reply(new_fields, pending[0])
+        if (not was_sufficient and not self.user_profile["previous_withdrawals"]
+                and SPECULATION_WORKERS > 0 and self._needs_model_for_final_answer()):
+            # Ask the optional question and get the model's final answer ready while the user
+            # replies; a rule-engine verdict needs no head start, so it is given right away
+            self.conversation_state = "confirming"
+            self._speculate_final_answer()
+            return flow.reply(new_fields, INTAKE_QUESTIONS["previous_withdrawals"])
+        return None
+
+    def _build_chat_turn(self, user_input: str, speculation_wait: Optional[float] = REQUEST_TIMEOUT_SECONDS
+                         ) -> Tuple[Prompt, str, Optional[str]]:
+        """Update the profile, record the user turn and build the prompt and cache key.
+
+        The third element is a templated intake reply, or a rule-engine, speculative or FAQ
+        answer, that makes the model call unnecessary.
+        """
+        was_sufficient = self._has_sufficient_info()
         
-        # Determine if we have enough information for a complete answer
-        has_sufficient_info = all([
-            self.user_profile["pf_contribution"],
-            self.user_profile["service_years"],
-            self.user_profile["withdrawal_type"]
-        ])
+        # Update user profile based on input; a bare "Yes" or "5" answers the question asked last
+        # The category in a reply to "If yes, under which category?" is a past withdrawal, not a new purpose
+        new_fields = self._update_user_profile(
+            user_input, only=("previous_withdrawals",) if self.conversation_state == "confirming" else None
+        )
+        if not new_fields and self.pending_questions and "?" not in user_input:
+            new_fields = self.flow.answer_pending(user_input, self.pending_questions[0])
+            self.user_profile.update(new_fields)
         
-        next_question = self._determine_next_question()
+        # Render the history before recording this turn so the input is not sent twice
+        history = self._format_conversation_history()
+        self._add_message("user", user_input)
         
-        prompt = f"""
-        You are a friendly and knowledgeable PF withdrawal assistant. The user is asking: "{user_input}"
+        # Turns that only answer an intake question get a templated reply, no model call
+        intake_reply = self._intake_turn(user_input, new_fields, was_sufficient)
+        if intake_reply is not None:
+            self.metrics.inc("pfbot_flow_turns_total", labels={"kind": "intake"})
+            return Prompt("", ""), "", intake_reply
         
-        User Profile Context:{profile_context}
+        # A reply to the optional question completes the intake and gets the final answer
+        final_turn = False
+        if self.conversation_state == "confirming":
+            self.conversation_state = "complete"
+            if "?" not in user_input:
+                previous = self.flow.parse_previous_withdrawals(user_input, new_fields)
+                if previous:
+                    self.user_profile["previous_withdrawals"] = previous
+                final_turn = True
         
-        Previous conversation context:
-        {self._format_conversation_history()}
+        # Create a personalized prompt based on user profile
+        profile_context = self._profile_context()
         
-        Current Situation:
-        - Has sufficient information for complete answer: {has_sufficient_info}
-        - Next question to ask: {next_question if next_question else "None"}
+        # Determine if we have enough information for a complete answer
+        has_sufficient_info = self._has_sufficient_info()
+        if has_sufficient_info and self.conversation_state in ("initial", "collecting"):
+            self.conversation_state = "complete"
+            self.pending_questions.clear()
         
-        Instructions:
-        1. Respond in a warm, conversational tone using "you" and "your"
-        2. If you have enough information, provide a complete, personalized answer about their PF withdrawal eligibility
-        3. If you need more information, ask the next question naturally in the conversation
-        4. Always mention specific EPFO rules and eligibility criteria when possible
-        5. Be encouraging and supportive in your tone
-        6. Use bullet points or numbered lists for clarity when appropriate
-        7. If mentioning amounts, use realistic examples (e.g., "up to ₹2-3 lakhs" for home loan withdrawal)
-        8. If asking a question, make it feel natural and conversational, not like an interrogation
+        if final_turn and has_sufficient_info and self._needs_model_for_final_answer():
+            speculative = self.engine.speculative_answer(self._final_answer_key(), speculation_wait)
+            if speculative is not None:
+                self.metrics.inc("pfbot_flow_turns_total", labels={"kind": "speculative"})
+                return Prompt("", ""), "", speculative
         
-        Response Guidelines:
-        - If you have sufficient info: Provide complete eligibility analysis with specific rules and amounts
-        - If missing info: Acknowledge what you understand, then ask the next question naturally
-        - Always be helpful and encouraging, regardless of their situation
+        # Plain eligibility lookups are answered locally; open-ended follow-ups go to the model
+        verdict = None
+        if has_sufficient_info and (not was_sufficient or final_turn or ELIGIBILITY_CUES.search(user_input)):
+            verdict = self._rule_verdict()
+        local_answer = None
+        if verdict and not self.rephrase_rule_answers:
+            local_answer = self.rule_engine.format_answer(verdict, self.user_profile["service_years"])
+        if verdict and self.rephrase_rule_answers:
+            profile_context += f"\n- Verified eligibility result: {self.rule_engine.format_answer(verdict)}"
         
-        Remember: You're helping someone with their personal finances, so be empathetic and clear. Make them feel confident about their financial decisions.
-        """
+        next_question = self._determine_next_question()
+        if next_question:
+            # The reply ends with this question, so the user's next turn may be a bare answer to it
+            self.pending_questions[:] = self.flow.missing_questions(self.user_profile)
+            if self.conversation_state == "initial":
+                self.conversation_state = "collecting"
+        
+        # Paraphrases of a FAQ entry are answered from the corpus; weaker matches send the
+        # model only the top snippets instead of the full free-form prompt
+        faq_hits = [] if verdict else self.faq_index.search(user_input)
+        faq_decision = self.faq_index.decide(faq_hits)
+        if faq_decision == "answer":
+            local_answer = faq_hits[0][1]["answer"]
+            if next_question:
+                local_answer += f"\n\nTo tell you exactly what you can withdraw: {next_question}"
+        
+        if faq_decision == "context":
+            prompt = Prompt(RETRIEVAL_INSTRUCTIONS, RETRIEVAL_TURN_TEMPLATE.format(
+                snippets="\n\n".join(self.faq_index.snippets(faq_hits)),
+                profile_context=profile_context,
+                next_question=next_question or "None",
+                user_input=user_input,
+            ))
+        else:
+            prompt = Prompt(CHAT_INSTRUCTIONS, CHAT_TURN_TEMPLATE.format(
+                profile_context=profile_context,
+                history=history,
+                has_sufficient_info=has_sufficient_info,
+                next_question=next_question or "None",
+                user_input=user_input,
+            ))
+        
+        # Answers are keyed on the profile and question, so repeated questions from
+        # users with the same intake answers are served without a model round trip
+        cache_key = make_cache_key(CHAT_TEMPLATE_VERSION, self.user_profile, user_input)
+        return prompt, cache_key, local_answer
+
+    def get_response(self, user_input: str) -> str:
+        prompt, cache_key, local_answer = self._prepare_chat_turn(user_input)
+        cached = local_answer or self.cache.get(cache_key)
+        if cached is not None:
+            self._add_message("assistant", cached)
+            self._record_answer("local" if local_answer else "cache")
+            return cached
         
         try:
-            # Get response from Gemini
-            response = self.model.generate_content(prompt)
+            # Get response from the model
+            response = self._call_model(prompt, "chat")
             
             # Add bot response to history
             bot_response = response.text
-            self.conversation_history.append({"role": "assistant", "content": bot_response})
+            self.cache.set(cache_key, bot_response)
+            self._add_message("assistant", bot_response)
+            self._record_answer("model")
             
             return bot_response
             
         except Exception as e:
-            return f"I apologize, but I encountered an error: {str(e)}"
+            return self._fallback_answer(e)
+
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """Yield the answer in chunks as the model produces them.
 
-    def get_personalized_withdrawal_advice(self, user_answers: Dict) -> str:
-        """Get personalized withdrawal advice based on user answers."""
-        self.user_profile.update(user_answers)
+        The full text is committed to the conversation history once the stream finishes.
+        """
+        prompt, cache_key, local_answer = self._prepare_chat_turn(user_input)
+        cached = local_answer or self.cache.get(cache_key)
+        if cached is not None:
+            self._add_message("assistant", cached)
+            self._record_answer("local" if local_answer else "cache")
+            yield cached
+            return
         
-        # Extract service years from the answer
-        service_years = None
-        if user_answers.get('service_years'):
-            import re
-            years_match = re.search(r'(\d+)\s*years?', user_answers['service_years'].lower())
-            if years_match:
-                service_years = int(years_match.group(1))
+        chunks = []
+        start = time.perf_counter()
+        try:
+            chunk, stream = self._open_stream(prompt)
+        except Exception as e:
+            self._record_model_call("chat_stream", prompt, time.perf_counter() - start, error=e)
+            yield self._fallback_answer(e)
+            return
+        try:
+            for chunk in itertools.chain([chunk] if chunk is not None else [], stream):
+                text = chunk.text
+                if text:
+                    if not chunks:
+                        self.metrics.observe("pfbot_first_chunk_seconds", time.perf_counter() - start)
+                    chunks.append(text)
+                    yield text
+        except Exception as e:
+            self._record_model_call("chat_stream", prompt, time.perf_counter() - start, error=e)
+            yield f"I apologize, but I encountered an error: {str(e)}"
+            return
+        # Usage metadata arrives with the final chunk
+        self._record_model_call("chat_stream", prompt, time.perf_counter() - start, chunk)
         
-        # Determine withdrawal type
-        withdrawal_type = user_answers.get('withdrawal_type', '').lower()
-        is_home_loan = 'home loan' in withdrawal_type or 'loan' in withdrawal_type
-        is_partial = 'partial' in withdrawal_type
+        bot_response = "".join(chunks)
+        self.cache.set(cache_key, bot_response)
+        self._add_message("assistant", bot_response)
+        self._record_answer("model")
+
+    async def _generate_async(self, prompt: Prompt, kind: str, timeout: Optional[float] = None):
+        """Call the async model client through the call layer, under the shared concurrency limit.
+
+        `timeout` bounds all attempts together; each attempt also has its own deadline.
+        """
+        async def attempt(attempt_timeout: Optional[float]):
+            start = time.perf_counter()
+            try:
+                response = await self.backend.generate_content_async(
+                    prompt.text, system_instruction=prompt.system, timeout=attempt_timeout
+                )
+            except BaseException as e:
+                # Includes the cancellation raised when the attempt overruns its deadline
+                self._record_model_call(kind, prompt, time.perf_counter() - start, error=e)
+                raise
+            self._record_model_call(kind, prompt, time.perf_counter() - start, response)
+            return response
         
-        prompt = f"""
-        Please answer in a short, friendly, and conversational tone (3-5 sentences max).
-        Start with a clear eligibility statement based on the user's details.
-        Briefly mention the specific EPFO rule that applies.
-        End with a friendly nudge for the user to provide more details or ask a follow-up question.
+        return await self.engine.caller.call_async(attempt, key=prompt, timeout=timeout or REQUEST_TIMEOUT_SECONDS,
+                                                   limiter=_get_async_limiter())
+
+    async def get_response_async(self, user_input: str, timeout: Optional[float] = None) -> str:
+        """Async counterpart of get_response for serving many conversations on one event loop."""
+        # Never block the event loop on a speculative answer; use it only if it is already done
+        prompt, cache_key, local_answer = self._prepare_chat_turn(user_input, speculation_wait=0)
+        cached = local_answer or self.cache.get(cache_key)
+        if cached is not None:
+            self._add_message("assistant", cached)
+            self._record_answer("local" if local_answer else "cache")
+            return cached
         
-        User's Profile:
-        - PF Contribution: {user_answers.get('pf_contribution', 'Not specified')}
-        - Service Years: {user_answers.get('service_years', 'Not specified')} ({service_years} years if specified)
-        - Withdrawal Type: {user_answers.get('withdrawal_type', 'Not specified')}
-        - Previous Withdrawals: {user_answers.get('previous_withdrawals', 'Not specified')}
+        try:
+            response = await self._generate_async(prompt, "chat", timeout)
+            bot_response = response.text
+            self.cache.set(cache_key, bot_response)
+            self._add_message("assistant", bot_response)
+            self._record_answer("model")
+            return bot_response
+        except Exception as e:
+            return self._fallback_answer(e)
+
+    def _prepare_advice(self, user_answers: Dict) -> Tuple[Prompt, str, Optional[str]]:
+        """Timed wrapper around _build_advice."""
+        with self.metrics.timer("pfbot_prompt_build_seconds", {"kind": "advice"}):
+            return self._build_advice(user_answers)
+
+    def _build_advice(self, user_answers: Dict) -> Tuple[Prompt, str, Optional[str]]:
+        """Update the profile from the intake answers and build the prompt and cache key.
+
+        The third element is a rule-engine answer that makes the model call unnecessary.
         """
+        # Spreadsheet and JSON rows may hold numbers or booleans (10, "10", true); work on text
+        answers = {field: str(user_answers[field]).strip() for field in INTAKE_QUESTIONS
+                   if user_answers.get(field) is not None}
+        
+        # Run each free-text answer through the extractor so the profile holds normalized values
+        for field in ("pf_contribution", "service_years", "withdrawal_type"):
+            if answers.get(field):
+                self._update_user_profile(answers[field])
+        if answers.get("previous_withdrawals"):
+            previous = answers["previous_withdrawals"].lower()
+            self.user_profile["previous_withdrawals"] = (
+                "none" if previous.startswith(("no", "never", "false")) else "yes"
+            )
+        
+        # A bare number of years ("10", or 10.0 from a spreadsheet) is taken as is
+        years_answer = answers.get("service_years", "")
+        if re.fullmatch(r"[0-9]{1,2}(?:\.0+)?", years_answer):
+            service_years = int(float(years_answer))
+            self.user_profile["service_years"] = service_years
+        else:
+            service_years = PROFILE_EXTRACTOR.extract(years_answer).get("service_years")
+        
+        prompt_text = ADVICE_TEMPLATE.format(
+            pf_contribution=answers.get('pf_contribution', 'Not specified'),
+            service_years_answer=answers.get('service_years', 'Not specified'),
+            service_years=service_years,
+            withdrawal_type=answers.get('withdrawal_type', 'Not specified'),
+            previous_withdrawals=answers.get('previous_withdrawals', 'Not specified'),
+        )
+        
+        cache_key = make_cache_key(ADVICE_TEMPLATE_VERSION, user_answers)
+        
+        local_answer = None
+        verdict = self._rule_verdict()
+        if verdict and not self.rephrase_rule_answers:
+            local_answer = self.rule_engine.format_answer(verdict, self.user_profile["service_years"])
+        if verdict and self.rephrase_rule_answers:
+            prompt_text += f"\nVerified eligibility result:\n{self.rule_engine.format_answer(verdict)}\n"
+        return Prompt(ADVICE_INSTRUCTIONS, prompt_text), cache_key, local_answer
+
+    def get_personalized_withdrawal_advice(self, user_answers: Dict, raise_errors: bool = False) -> str:
+        """Get personalized withdrawal advice based on user answers.
+
+        With raise_errors, model failures propagate instead of becoming an apology message.
+        """
+        prompt, cache_key, local_answer = self._prepare_advice(user_answers)
+        cached = local_answer or self.cache.get(cache_key)
+        if cached is not None:
+            self._record_answer("local" if local_answer else "cache")
+            return cached
+        
+        try:
+            if self.engine.advice_batcher is not None:
+                batched = self.engine.advice_batcher.submit(prompt)
+                try:
+                    advice = batched.result(REQUEST_TIMEOUT_SECONDS)
+                except TimeoutError:
+                    # Drop it from its batch if it has not been sent yet
+                    batched.cancel()
+                    raise
+            else:
+                advice = self._call_model(prompt, "advice").text
+            self.cache.set(cache_key, advice)
+            self._record_answer("model")
+            return advice
+        except Exception as e:
+            if raise_errors:
+                raise
+            return self._fallback_answer(e)
+
+    async def get_personalized_withdrawal_advice_async(self, user_answers: Dict, timeout: Optional[float] = None) -> str:
+        """Async counterpart of get_personalized_withdrawal_advice."""
+        prompt, cache_key, local_answer = self._prepare_advice(user_answers)
+        cached = local_answer or self.cache.get(cache_key)
+        if cached is not None:
+            self._record_answer("local" if local_answer else "cache")
+            return cached
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            if self.engine.advice_batcher is not None:
+                batched = asyncio.wrap_future(self.engine.advice_batcher.submit(prompt))
+                advice = await asyncio.wait_for(batched, timeout or REQUEST_TIMEOUT_SECONDS)
+            else:
+                advice = (await self._generate_async(prompt, "advice", timeout)).text
+            self.cache.set(cache_key, advice)
+            self._record_answer("model")
+            return advice
         except Exception as e:
-            return f"I apologize, but I encountered an error: {str(e)}"
+            return self._fallback_answer(e)
 
     def clear_history(self):
         """Clear the conversation history."""
-        self.conversation_history = []
-        self.user_profile = {
-            "pf_contribution": None,
-            "service_years": None,
-            "withdrawal_type": None,
-            "previous_withdrawals": None,
-            "current_balance": None
-        }
-        self.conversation_state = "initial"
-        self.pending_questions = []
+        if self.engine.session_store is not None and self.session.session_id is not None:
+            self.engine.session_store.clear(self.session)
+        else:
+            self.session.reset()
 
 def main():
     # Get API key from environment variable
@@ -255,8 +1300,10 @@ def main():
             print("Conversation history cleared.")
             continue
             
-        response = bot.get_response(user_input)
-        print(f"\nPF Bot: {response}")
+        print("\nPF Bot: ", end="", flush=True)
+        for chunk in bot.stream_response(user_input):
+            print(chunk, end="", flush=True)
+        print()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+DEFAULT_GEMINI_MODEL = "models/gemini-2.0-flash"
+
+
+class ModelBackend:
+    """Interface PFBot uses to talk to a language model.
+
+    Responses expose `.text` and, where the backend knows it, `.usage_metadata`.
+    `system_instruction` carries the static part of the prompt separately from the
+    per-turn text. `timeout` is a per-call deadline in seconds; backends raise
+    TimeoutError (or their client's deadline error) once it passes.
+    """
+
+    def generate_content(self, prompt: str, stream: bool = False, system_instruction: Optional[str] = None,
+                         timeout: Optional[float] = None):
+        """Return a response, or an iterator of chunk responses when stream is set."""
+        raise NotImplementedError
+
+    async def generate_content_async(self, prompt: str, system_instruction: Optional[str] = None,
+                                     timeout: Optional[float] = None):
+        """Async counterpart of generate_content (non-streaming)."""
+        raise NotImplementedError
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini through the google-generativeai client."""
+
+    def __init__(self, api_key: str = "", model_name: str = DEFAULT_GEMINI_MODEL):
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") or api_key)
+        self._genai = genai
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        # One client per distinct system instruction; there are only a handful of templates
+        self._models: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _model_for(self, system_instruction: Optional[str]):
+        if not system_instruction:
+            return self.model
+        with self._lock:
+            model = self._models.get(system_instruction)
+            if model is None:
+                model = self._genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+                self._models[system_instruction] = model
+            return model
+
+    def generate_content(self, prompt: str, stream: bool = False, system_instruction: Optional[str] = None,
+                         timeout: Optional[float] = None):
+        request_options = {"timeout": timeout} if timeout else None
+        return self._model_for(system_instruction).generate_content(
+            prompt, stream=stream, request_options=request_options
+        )
+
+    async def generate_content_async(self, prompt: str, system_instruction: Optional[str] = None,
+                                     timeout: Optional[float] = None):
+        request_options = {"timeout": timeout} if timeout else None
+        return await self._model_for(system_instruction).generate_content_async(
+            prompt, request_options=request_options
+        )
+
+
+class StubBackendError(RuntimeError):
+    """Simulated upstream failure raised by StubBackend."""
+
+
+class StubResponse:
+    """Minimal stand-in for a Gemini response."""
+
+    def __init__(self, text: str, prompt_tokens: int = 0, response_tokens: int = 0):
+        self.text = text
+        self.usage_metadata = {
+            "prompt_token_count": prompt_tokens,
+            "candidates_token_count": response_tokens,
+            "total_token_count": prompt_tokens + response_tokens,
+        }
+
+
+class StubBackend(ModelBackend):
+    """Local deterministic model for benchmarks and load tests; needs no network or quota.
+
+    Each call waits `latency` seconds before the first token, then emits
+    `response_tokens` tokens at `tokens_per_second`, and fails with probability
+    `failure_rate`. The reply text depends only on the prompt.
+    """
+
+    def __init__(self, latency: float = 0.0, tokens_per_second: float = 0.0, response_tokens: int = 60,
+                 failure_rate: float = 0.0, seed: Optional[int] = None, chunk_tokens: int = 8):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.failure_rate = failure_rate
+        self.chunk_tokens = chunk_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _should_fail(self) -> bool:
+        if not self.failure_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _tokens(self, prompt: str):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return [digest[i % 56:i % 56 + 8] for i in range(self.response_tokens)]
+
+    def _generation_time(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _response(self, prompt: str, tokens) -> StubResponse:
+        return StubResponse(" ".join(tokens), prompt_tokens=(len(prompt) + 3) // 4, response_tokens=len(tokens))
+
+    def _wait_for_first_token(self, timeout: Optional[float]):
+        if timeout is not None and self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"stub call exceeded its {timeout:g}s deadline")
+        time.sleep(self.latency)
+
+    def generate_content(self, prompt: str, stream: bool = False, system_instruction: Optional[str] = None,
+                         timeout: Optional[float] = None):
+        if stream:
+            return self._stream(prompt, timeout)
+        self._wait_for_first_token(timeout)
+        if self._should_fail():
+            raise StubBackendError("429 simulated upstream failure")
+        tokens = self._tokens(prompt)
+        time.sleep(self._generation_time(len(tokens)))
+        return self._response(prompt, tokens)
+
+    def _stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[StubResponse]:
+        self._wait_for_first_token(timeout)
+        if self._should_fail():
+            raise StubBackendError("429 simulated upstream failure")
+        tokens = self._tokens(prompt)
+        for start in range(0, len(tokens), self.chunk_tokens):
+            chunk = tokens[start:start + self.chunk_tokens]
+            time.sleep(self._generation_time(len(chunk)))
+            if start + self.chunk_tokens >= len(tokens):
+                # Like Gemini, the final chunk carries the usage totals for the whole call
+                final = self._response(prompt, tokens)
+                final.text = " ".join(chunk)
+                yield final
+            else:
+                yield StubResponse(" ".join(chunk) + " ")
+
+    async def generate_content_async(self, prompt: str, system_instruction: Optional[str] = None,
+                                     timeout: Optional[float] = None):
+        if timeout is not None and self.latency > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError(f"stub call exceeded its {timeout:g}s deadline")
+        await asyncio.sleep(self.latency)
+        if self._should_fail():
+            raise StubBackendError("429 simulated upstream failure")
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self._generation_time(len(tokens)))
+        return self._response(prompt, tokens)
+
+
+def create_backend(api_key: str = "", name: Optional[str] = None) -> ModelBackend:
+    """Build the backend named by `name` or PFBOT_BACKEND ("gemini" by default, or "stub").
+
+    The stub reads PFBOT_STUB_LATENCY, PFBOT_STUB_TPS and PFBOT_STUB_FAILURE_RATE.
+    """
+    name = (name or os.getenv("PFBOT_BACKEND", "gemini")).lower()
+    if name == "stub":
+        return StubBackend(
+            latency=float(os.getenv("PFBOT_STUB_LATENCY", "0.5")),
+            tokens_per_second=float(os.getenv("PFBOT_STUB_TPS", "200")),
+            failure_rate=float(os.getenv("PFBOT_STUB_FAILURE_RATE", "0")),
+        )
+    if name == "gemini":
+        return GeminiBackend(api_key)
+    raise ValueError(f"Unknown model backend: {name}")
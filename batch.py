@@ -0,0 +1,190 @@
+"""Bulk personalized withdrawal advice for a file of employee intake answers.
+
+Usage:
+    python batch.py employees.jsonl advice.jsonl --workers 4 --rate 5
+    python batch.py employees.jsonl advice.jsonl --workers 16 --rate 50 --batch-window 0.05
+
+The input is JSONL or CSV; each row holds the same fields as the intake form
+(pf_contribution, service_years, withdrawal_type, previous_withdrawals) and an
+optional "id". Results are appended to the output JSONL as they finish, so
+re-running the same command resumes and skips rows that already succeeded.
+
+--rate paces rows, not model calls: retries of a failed call happen inside the
+row (spaced by --backoff) and are not counted against it, so the upstream can
+briefly see more than --rate calls per second while it is recovering.
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Set, Tuple
+
+from Work import ATTEMPT_TIMEOUT_SECONDS, BREAKER_FAILURES, BREAKER_RESET_SECONDS, PFBot, PFEngine
+from resilience import CircuitBreaker, ResilientCaller
+
+
+class RateLimiter:
+    """Spaces calls evenly so that at most `rate` start per second across all threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def read_rows(path: str) -> Iterator[Tuple[str, Dict]]:
+    """Yield (row id, user_answers) pairs from a JSONL or CSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for index, record in enumerate(records):
+            row_id = str(record.pop("id", None) or index)
+            yield row_id, record
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+class BatchRunner:
+    """Runs get_personalized_withdrawal_advice over many rows with bounded concurrency."""
+
+    def __init__(self, api_key: str, workers: int = 4, rate: float = 5.0, retries: int = 3, backoff: float = 1.0,
+                 batch_window: float = 0.0, batch_size: int = 8):
+        # Retries happen once, in the engine's call layer, which also backs off and stops
+        # calling while the circuit is open; rows that still fail are retried by re-running
+        caller = ResilientCaller(
+            CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS),
+            retries=retries, backoff=backoff, attempt_timeout=ATTEMPT_TIMEOUT_SECONDS,
+        )
+        # With a batch window, rows in flight together share model calls (keep workers >= batch_size)
+        self.engine = PFEngine(api_key, caller=caller,
+                               advice_batch_window=batch_window, advice_batch_size=batch_size)
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate)
+        self._local = threading.local()
+
+    def _bot(self) -> PFBot:
+        # One session per worker thread over the shared engine; the profile is reset before every row
+        bot = getattr(self._local, "bot", None)
+        if bot is None:
+            bot = self._local.bot = PFBot(engine=self.engine)
+        bot.clear_history()
+        return bot
+
+    def process(self, row_id: str, user_answers: Dict) -> Dict:
+        """Produce advice for one row; the engine retries failed model calls with backoff."""
+        start = time.perf_counter()
+        self.rate_limiter.wait()
+        try:
+            advice = self._bot().get_personalized_withdrawal_advice(user_answers, raise_errors=True)
+        except Exception as e:
+            return {"id": row_id, "status": "error", "error": f"{type(e).__name__}: {e}",
+                    "latency_s": round(time.perf_counter() - start, 3)}
+        return {"id": row_id, "status": "ok", "advice": advice,
+                "latency_s": round(time.perf_counter() - start, 3)}
+
+    def run(self, input_path: str, output_path: str) -> Dict:
+        """Process every pending row of input_path, appending results to output_path."""
+        done = completed_ids(output_path)
+        skipped = 0
+        latencies: List[float] = []
+        failed = 0
+        start = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(self.workers) as pool:
+            pending = set()
+
+            def drain(return_when):
+                nonlocal failed
+                finished, still_pending = wait(pending, return_when=return_when)
+                for future in finished:
+                    result = future.result()
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                    latencies.append(result["latency_s"])
+                    failed += result["status"] != "ok"
+                return still_pending
+
+            for row_id, user_answers in read_rows(input_path):
+                if row_id in done:
+                    skipped += 1
+                    continue
+                pending.add(pool.submit(self.process, row_id, user_answers))
+                # Keep only a small window of rows in flight so huge files stream through
+                if len(pending) >= self.workers * 2:
+                    pending = drain(FIRST_COMPLETED)
+            if pending:
+                drain(ALL_COMPLETED)
+
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        processed = len(latencies)
+        return {
+            "processed": processed,
+            "succeeded": processed - failed,
+            "failed": failed,
+            "skipped": skipped,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_s": round(processed / elapsed, 2) if elapsed else 0.0,
+            "p50_latency_s": latencies[processed // 2] if latencies else None,
+            "p95_latency_s": latencies[min(processed - 1, int(processed * 0.95))] if latencies else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate PF withdrawal advice for a file of user answers")
+    parser.add_argument("input", help="JSONL or CSV file of user answers")
+    parser.add_argument("output", help="JSONL file results are appended to (also the resume checkpoint)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=5.0, help="maximum rows started per second (retries are not rate limited)")
+    parser.add_argument("--retries", type=int, default=3, help="retries per model call after a retryable error")
+    parser.add_argument("--backoff", type=float, default=1.0,
+                        help="base seconds of the jittered exponential backoff between retries")
+    parser.add_argument("--batch-window", type=float, default=0.0,
+                        help="seconds to gather concurrent rows into one model call (0 disables)")
+    parser.add_argument("--batch-size", type=int, default=8, help="maximum rows per batched model call")
+    args = parser.parse_args()
+
+    api_key = os.getenv("GEMINI_API_KEY", "")
+    runner = BatchRunner(api_key, workers=args.workers, rate=args.rate, retries=args.retries,
+                         backoff=args.backoff, batch_window=args.batch_window, batch_size=args.batch_size)
+    summary = runner.run(args.input, args.output)
+
+    print(f"Processed {summary['processed']} rows ({summary['succeeded']} ok, {summary['failed']} failed), "
+          f"skipped {summary['skipped']} already done")
+    if summary["processed"]:
+        print(f"Elapsed {summary['elapsed_s']}s, {summary['rows_per_s']} rows/s, "
+              f"p50 {summary['p50_latency_s']}s, p95 {summary['p95_latency_s']}s")
+
+
+if __name__ == "__main__":
+    main()
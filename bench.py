@@ -0,0 +1,240 @@
+"""Micro-benchmarks for PF Bot internals.
+
+Usage:
+    python bench.py extractor [--messages 100000]
+    python bench.py conversation [--sessions 50] [--latency 0.0]
+    python bench.py calculator [--employees 50000]
+"""
+import argparse
+import random
+import re
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from backends import StubBackend
+from cache import ResponseCache
+from extractor import PROFILE_EXTRACTOR
+from Work import PFBot, WithdrawalCalculator
+
+SAMPLE_MESSAGES = [
+    "Yes, I'm still employed and contributing to my PF.",
+    "No, I'm not contributing currently.",
+    "I have been working for 12 years",
+    "I want to withdraw for a home loan",
+    "Can I use my PF for my daughter's marriage?",
+    "I have never withdrawn from my PF earlier",
+    "What documents do I need for a medical emergency claim?",
+    "I am unemployed since 3 months, 4 years of service",
+    "Is renovation of my house allowed after 6 years?",
+    "thanks, that helps a lot!",
+]
+
+
+# Multi-turn scripts: intake answers first, then open-ended follow-ups
+CONVERSATION_SCRIPTS = [
+    [
+        "Hi, I want to know about withdrawing my PF",
+        "Yes, I'm still employed and contributing",
+        "I have been contributing for 12 years",
+        "I want to repay my home loan",
+        "What documents will I need?",
+        "How long does the claim take to settle?",
+        "Will it affect my pension?",
+        "Can I apply online?",
+        "What if my KYC is not updated?",
+        "Thanks, anything else I should keep in mind?",
+    ],
+    [
+        "I lost my job two months ago",
+        "No, I'm not contributing currently since I'm unemployed",
+        "4 years of service",
+        "unemployment withdrawal please",
+        "Do I have to pay tax on it?",
+        "Should I transfer instead of withdrawing?",
+        "How is the interest calculated for my balance?",
+        "What happens to my employer's share?",
+    ],
+]
+
+
+class RecordingBackend(StubBackend):
+    """Stub backend that records the bytes of every request it receives (instruction plus prompt)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompt_bytes: List[int] = []
+        self.system_instructions = set()
+
+    def generate_content(self, prompt: str, stream: bool = False, system_instruction=None, timeout=None):
+        # The system instruction is sent with every request, so it counts towards each one
+        self.prompt_bytes.append(len(prompt.encode("utf-8")) + len((system_instruction or "").encode("utf-8")))
+        if system_instruction:
+            self.system_instructions.add(system_instruction)
+        return super().generate_content(prompt, stream=stream, system_instruction=system_instruction, timeout=timeout)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_conversation(args):
+    backend = RecordingBackend(latency=args.latency, tokens_per_second=args.tps)
+    turn_latencies: Dict[int, List[float]] = {}
+    turn_prompt_bytes: Dict[int, List[int]] = {}
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    bots = []
+    for session in range(args.sessions):
+        script = CONVERSATION_SCRIPTS[session % len(CONVERSATION_SCRIPTS)]
+        # A private cache per session so every turn exercises the full prompt path
+        bot = PFBot("", cache=ResponseCache(), backend=backend)
+        bots.append(bot)
+        for turn, message in enumerate(script, start=1):
+            calls_before = len(backend.prompt_bytes)
+            start = time.perf_counter()
+            bot.get_response(f"{message} (session {session})")
+            turn_latencies.setdefault(turn, []).append(time.perf_counter() - start)
+            if len(backend.prompt_bytes) > calls_before:
+                turn_prompt_bytes.setdefault(turn, []).append(backend.prompt_bytes[-1])
+    memory_per_session = (tracemalloc.get_traced_memory()[0] - baseline) / len(bots)
+    tracemalloc.stop()
+
+    print(f"{args.sessions} scripted sessions, stub latency {args.latency}s")
+    print(f"{'turn':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'bytes sent':>13}")
+    for turn in sorted(turn_latencies):
+        latencies = turn_latencies[turn]
+        sizes = turn_prompt_bytes.get(turn)
+        prompt_size = f"{sum(sizes) / len(sizes):13,.0f}" if sizes else f"{'(no call)':>13}"
+        print(f"{turn:>4} {_percentile(latencies, 0.50) * 1000:9.2f} {_percentile(latencies, 0.95) * 1000:9.2f} "
+              f"{_percentile(latencies, 0.99) * 1000:9.2f} {prompt_size}")
+    sizes = ", ".join(f"{len(s.encode('utf-8')):,}" for s in sorted(backend.system_instructions, key=len))
+    print(f"bytes sent include the system instruction; {len(backend.system_instructions)} distinct, "
+          f"of {sizes} bytes")
+    print(f"memory per session: {memory_per_session / 1024:.1f} KiB (traced, including history)")
+
+
+def _legacy_extract(user_input: str) -> Dict:
+    """The original per-message extraction, kept as the benchmark baseline."""
+    profile = {}
+    if "contributing" in user_input.lower() or "employed" in user_input.lower():
+        if "yes" in user_input.lower() or "still" in user_input.lower() or "active" in user_input.lower():
+            profile["pf_contribution"] = "active"
+        elif "no" in user_input.lower() or "not" in user_input.lower() or "unemployed" in user_input.lower():
+            profile["pf_contribution"] = "inactive"
+    years_match = re.search(r'(\d+)\s*years?', user_input.lower())
+    if years_match:
+        profile["service_years"] = int(years_match.group(1))
+    withdrawal_keywords = {
+        "home loan": "home_loan_repayment",
+        "house": "house_purchase",
+        "medical": "medical_emergency",
+        "education": "education",
+        "marriage": "marriage",
+        "unemployment": "unemployment",
+        "renovation": "home_renovation",
+        "retirement": "retirement"
+    }
+    for keyword, withdrawal_type in withdrawal_keywords.items():
+        if keyword in user_input.lower():
+            profile["withdrawal_type"] = withdrawal_type
+            break
+    if "withdrawn" in user_input.lower() or "earlier" in user_input.lower():
+        if "no" in user_input.lower() or "never" in user_input.lower():
+            profile["previous_withdrawals"] = "none"
+        else:
+            profile["previous_withdrawals"] = "yes"
+    return profile
+
+
+def _time(label: str, func: Callable[[List[str]], object], messages: List[str]) -> float:
+    start = time.perf_counter()
+    func(messages)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed * 1000:9.1f} ms  {len(messages) / elapsed:12,.0f} msg/s")
+    return elapsed
+
+
+def bench_extractor(args):
+    messages = random.Random(0).choices(SAMPLE_MESSAGES, k=args.messages)
+    print(f"Profile extraction over {len(messages):,} messages")
+    legacy = _time("legacy substring scan", lambda batch: [_legacy_extract(m) for m in batch], messages)
+    compiled = _time("compiled extractor", PROFILE_EXTRACTOR.extract_many, messages)
+    print(f"speedup: {legacy / compiled:.2f}x")
+
+
+def bench_calculator(args):
+    rng = np.random.default_rng(0)
+    n = args.employees
+    # A synthetic workforce: wages, shares that grow with service, a few unemployed members
+    service_years = rng.integers(0, 35, n)
+    basic_wage = rng.uniform(15_000, 150_000, n).round()
+    unemployed = rng.random(n) < 0.05
+    population = {
+        "basic_wage": basic_wage,
+        "da": (basic_wage * rng.uniform(0, 0.5, n)).round(),
+        "employee_share": basic_wage * 0.12 * 12 * service_years * rng.uniform(1.0, 1.6, n),
+        "employer_share": basic_wage * 0.0367 * 12 * service_years * rng.uniform(1.0, 1.6, n),
+        "service_years": service_years,
+        "age": service_years + rng.integers(21, 30, n),
+        "unemployed": unemployed,
+        "months_unemployed": np.where(unemployed, rng.integers(0, 6, n), 0),
+    }
+    calculator = WithdrawalCalculator()
+    categories = len(calculator.formulas)
+    print(f"Withdrawal limits for {n:,} employees x {categories} categories")
+
+    start = time.perf_counter()
+    results = calculator.calculate(population)
+    vectorized = time.perf_counter() - start
+    print(f"{'vectorized batch':<22} {vectorized * 1000:9.1f} ms  {n / vectorized:12,.0f} employees/s")
+
+    # The single-employee API row by row, on a sample, as the baseline
+    sample = min(n, args.sample)
+    rows = [{name: column[i].item() for name, column in population.items()} for i in range(sample)]
+    start = time.perf_counter()
+    singles = [calculator.calculate_one(**row) for row in rows]
+    per_row = time.perf_counter() - start
+    print(f"{'per-employee calls':<22} {per_row * 1000:9.1f} ms  {sample / per_row:12,.0f} employees/s "
+          f"({sample:,} sampled)")
+    print(f"speedup: {(per_row / sample) / (vectorized / n):.0f}x")
+
+    for i, single in enumerate(singles):
+        for withdrawal_type, result in single.items():
+            assert result["eligible"] == results[withdrawal_type]["eligible"][i]
+            assert np.isclose(result["limit"], results[withdrawal_type]["limit"][i])
+    for withdrawal_type, result in results.items():
+        eligible = result["eligible"]
+        print(f"  {withdrawal_type:<20} {eligible.mean():6.1%} eligible, "
+              f"median amount {np.median(result['amount'][eligible]) if eligible.any() else 0:12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PF Bot micro-benchmarks")
+    subcommands = parser.add_subparsers(dest="benchmark", required=True)
+
+    extractor_parser = subcommands.add_parser("extractor", help="profile extraction throughput")
+    extractor_parser.add_argument("--messages", type=int, default=100_000)
+    extractor_parser.set_defaults(func=bench_extractor)
+
+    conversation_parser = subcommands.add_parser("conversation", help="scripted multi-turn get_response runs")
+    conversation_parser.add_argument("--sessions", type=int, default=50)
+    conversation_parser.add_argument("--latency", type=float, default=0.0, help="stub time to first token (s)")
+    conversation_parser.add_argument("--tps", type=float, default=0.0, help="stub tokens per second (0 = instant)")
+    conversation_parser.set_defaults(func=bench_conversation)
+
+    calculator_parser = subcommands.add_parser("calculator", help="vectorized withdrawal-limit throughput")
+    calculator_parser.add_argument("--employees", type=int, default=50_000)
+    calculator_parser.add_argument("--sample", type=int, default=2_000, help="rows for the per-employee baseline")
+    calculator_parser.set_defaults(func=bench_calculator)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+PROFILE_FIELDS = (
+    "pf_contribution",
+    "service_years",
+    "withdrawal_type",
+    "previous_withdrawals",
+    "current_balance",
+    "basic_wage",
+)
+
+
+def normalize_text(text) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    if text is None:
+        return ""
+    text = re.sub(r"\s+", " ", str(text).strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def make_cache_key(template_version: str, user_profile: Dict, question: str = "") -> str:
+    """Build a stable cache key from the inputs that drive an answer."""
+    payload = {
+        "template": template_version,
+        "profile": {field: normalize_text(user_profile.get(field)) for field in PROFILE_FIELDS},
+        "question": normalize_text(question),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Longest gap between sweeps of expired rows from the SQLite tier
+PURGE_INTERVAL_SECONDS = 300.0
+
+
+class ResponseCache:
+    """In-memory LRU cache with TTL and an optional SQLite tier shared across workers."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        # Expired disk rows are deleted by set(), at most once per interval
+        self.purge_interval = min(ttl_seconds, PURGE_INTERVAL_SECONDS)
+        self._next_purge = 0.0
+        if db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # A short-lived connection per operation keeps this safe across Streamlit threads
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if row and row[1] > now:
+                with self._lock:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        """Store value under key in every configured tier."""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+            purge = self.db_path and now >= self._next_purge
+            if purge:
+                self._next_purge = now + self.purge_interval
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                if purge:
+                    # Reads skip expired rows; this keeps a shared cache file from growing forever
+                    conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+
+    def _store(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry, including the disk tier."""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,165 @@
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+from session_store import SessionStore
+
+# Messages shown at first and added per "Load earlier messages" click
+CHAT_PAGE_SIZE = 20
+
+CHAT_CSS = """
+    <style>
+    html, body, [class*="css"] {
+        font-family: 'Inter', 'Segoe UI', Arial, sans-serif !important;
+        background: #181a20 !important;
+    }
+    .pf-section-title {
+        font-size: 1.12em;
+        font-weight: 700;
+        margin: 10px 0 8px 0;
+        color: #90caf9;
+        letter-spacing: 0.01em;
+    }
+    .pf-chat-outer {
+        display: flex;
+        flex-direction: column;
+        align-items: center;
+        width: 100%;
+        margin-bottom: 0;
+    }
+    .pf-chat-area {
+        width: 100%;
+        max-width: 540px;
+        min-height: 80px;
+        max-height: 320px;
+        overflow-y: auto;
+        background: transparent;
+        border-radius: 0;
+        border: none;
+        display: flex;
+        flex-direction: column;
+        justify-content: flex-end;
+        margin-bottom: 0;
+        padding-bottom: 0;
+    }
+    .pf-chat-user {
+        display: flex;
+        justify-content: flex-end;
+        margin: 0.2em 0;
+    }
+    .pf-chat-bot {
+        display: flex;
+        justify-content: flex-start;
+        margin: 0.2em 0;
+    }
+    .pf-bubble-user {
+        background: #1976d2;
+        color: #fff;
+        padding: 10px 16px;
+        border-radius: 18px 18px 6px 18px;
+        max-width: 80%;
+        min-width: 40px;
+        box-shadow: 0 1px 4px rgba(25,118,210,0.10);
+        font-size: 1em;
+        font-weight: 500;
+        word-break: break-word;
+        white-space: pre-line;
+        display: inline-block;
+    }
+    .pf-bubble-bot {
+        background: #23272f;
+        color: #fff;
+        padding: 10px 16px;
+        border-radius: 18px 18px 18px 6px;
+        max-width: 80%;
+        min-width: 40px;
+        box-shadow: 0 1px 4px rgba(0,0,0,0.10);
+        font-size: 1em;
+        font-weight: 500;
+        word-break: break-word;
+        white-space: pre-line;
+        display: inline-block;
+        border: 1px solid #23272f;
+    }
+    .pf-chat-input-bar {
+        background: #23272f;
+        border-radius: 18px;
+        padding: 6px 10px;
+        border: 1.5px solid #23272f;
+        width: 100%;
+        max-width: 540px;
+        display: flex;
+        align-items: center;
+        gap: 8px;
+        box-shadow: 0 1px 4px rgba(0,0,0,0.10);
+        margin-top: 0.5em;
+    }
+    .pf-chat-input {
+        border: none;
+        outline: none;
+        flex: 1;
+        font-size: 1em;
+        font-family: 'Inter', 'Segoe UI', Arial, sans-serif;
+        background: transparent;
+        color: #fff;
+    }
+    input.pf-chat-input::placeholder {
+        color: #b0b8c1;
+    }
+    </style>
+"""
+
+
+def inject_css():
+    """Emit the stylesheet as one element, ahead of everything that uses it."""
+    st.markdown(CHAT_CSS, unsafe_allow_html=True)
+
+
+def render_bubble(role: str, content: str) -> str:
+    """HTML for one chat bubble."""
+    if role == "user":
+        return f"<div class='pf-chat-user'><div class='pf-bubble-user'>🧑 {content}</div></div>"
+    return f"<div class='pf-chat-bot'><div class='pf-bubble-bot'>🤖 {content}</div></div>"
+
+
+@lru_cache(maxsize=4096)
+def bubble_html(role: str, content: str) -> str:
+    """Memoized render_bubble for finished messages, which never change once recorded."""
+    return render_bubble(role, content)
+
+
+def visible_messages(history: List[Dict], count: int, store: Optional[SessionStore] = None,
+                     session_id: Optional[str] = None) -> List[Dict]:
+    """The last `count` messages, paging ones older than the in-memory history from the store."""
+    if count <= len(history):
+        return history[-count:]
+    first_seq = history[0].get("seq") if history else None
+    if store is None or session_id is None or not first_seq:
+        return history
+    return store.load_messages(session_id, limit=count - len(history), before=first_seq) + history
+
+
+def _load_earlier(page_size: int):
+    st.session_state.chat_visible += page_size
+
+
+def render_chat(history: List[Dict], total: int, store: Optional[SessionStore] = None,
+                session_id: Optional[str] = None, page_size: int = CHAT_PAGE_SIZE):
+    """Draw a window of the conversation as a single element, with a button to page back.
+
+    Only the window is rendered, and each bubble's HTML is built once, so redraw cost
+    does not grow with the length of the conversation.
+    """
+    if "chat_visible" not in st.session_state:
+        st.session_state.chat_visible = page_size
+    count = st.session_state.chat_visible
+    if total > count:
+        st.button("⬆ Load earlier messages", key="chat_load_earlier", on_click=_load_earlier, args=(page_size,))
+    bubbles = "".join(bubble_html(m["role"], m["content"]) for m in visible_messages(history, count, store, session_id))
+    st.markdown(f"<div class='pf-chat-outer'><div class='pf-chat-area'>{bubbles}</div></div>", unsafe_allow_html=True)
+
+
+def reset_window():
+    """Show only the latest page again, e.g. after the history is cleared."""
+    st.session_state.pop("chat_visible", None)
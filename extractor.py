@@ -0,0 +1,142 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Withdrawal keywords in priority order: when a message mentions several, the earliest entry wins
+WITHDRAWAL_KEYWORDS = {
+    "home loan": "home_loan_repayment",
+    "house": "house_purchase",
+    "medical": "medical_emergency",
+    "education": "education",
+    "marriage": "marriage",
+    "unemployment": "unemployment",
+    "renovation": "home_renovation",
+    "retirement": "retirement",
+}
+
+CONTRIBUTION_TOPIC = 1
+AFFIRMATION = 2
+NEGATION = 4
+WITHDRAWAL_TOPIC = 8
+WITHDRAWAL_NEGATION = 16
+BALANCE_TOPIC = 32
+WAGE_TOPIC = 64
+
+# Every other cue word and the flags it raises; one word can raise several flags
+CUE_FLAGS = {
+    "contributing": CONTRIBUTION_TOPIC,
+    "employed": CONTRIBUTION_TOPIC,
+    "unemployed": CONTRIBUTION_TOPIC | NEGATION,
+    "yes": AFFIRMATION,
+    "still": AFFIRMATION,
+    "active": AFFIRMATION,
+    "inactive": NEGATION,
+    "no": NEGATION | WITHDRAWAL_NEGATION,
+    "not": NEGATION | WITHDRAWAL_NEGATION,
+    "never": WITHDRAWAL_NEGATION,
+    "haven't": WITHDRAWAL_NEGATION,
+    "withdrawn": WITHDRAWAL_TOPIC,
+    "earlier": WITHDRAWAL_TOPIC,
+    "balance": BALANCE_TOPIC,
+    "corpus": BALANCE_TOPIC,
+    "basic": WAGE_TOPIC,
+    "salary": WAGE_TOPIC,
+    "wage": WAGE_TOPIC,
+    "wages": WAGE_TOPIC,
+}
+
+YEARS_PATTERN = r"[0-9]+\s*years?"
+# A rupee amount ("40000", "3,50,000", "45k", "3.5 lakh") directly after a balance or wage cue,
+# with at most a connector ("is", ":", "Rs") between them; percentages are not amounts
+AMOUNT_PATTERN = re.compile(
+    r"\b(balance|corpus|basic|salary|wages?)\b(?:\s+(?:wages?|salary|pay))?"
+    r"(?:\s*(?:\b(?:is|was|are|of|about|around)\b|rs\b\.?|inr\b|₹|:|=|-))*\s*"
+    r"([0-9][0-9,]*(?:\.[0-9]+)?)(?![0-9]|\.[0-9]|\s*%)(\s*(?:lakhs?|lacs?|crores?|k)\b)?"
+)
+AMOUNT_UNITS = {"k": 1e3, "lakh": 1e5, "lakhs": 1e5, "lac": 1e5, "lacs": 1e5, "crore": 1e7, "crores": 1e7}
+AMOUNT_FIELDS = {"balance": "current_balance", "corpus": "current_balance"}
+
+
+def parse_amount(number: str, unit: str = "") -> Optional[float]:
+    """Rupee value of an amount and its unit, or None for a bare number that reads as a year."""
+    unit = unit.strip()
+    if not unit and "," not in number and "." not in number and 1900 <= int(number) <= 2099:
+        return None
+    return float(number.replace(",", "")) * AMOUNT_UNITS.get(unit, 1)
+
+
+def _trie_pattern(words: Iterable[str], extra_branches: Iterable[str] = ()) -> str:
+    """Build a regex alternation shaped like a trie so matching never backtracks across words."""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict, branches: Iterable[str] = ()) -> str:
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        alternatives.extend(branches)
+        if not alternatives:
+            return ""
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie, extra_branches)
+
+
+class ProfileExtractor:
+    """Extracts profile fields from a message in a single pass of one compiled regex."""
+
+    def __init__(self):
+        # Withdrawal keywords map to their priority (negative, so they never look like flags)
+        self.lookup = dict(CUE_FLAGS)
+        for priority, keyword in enumerate(WITHDRAWAL_KEYWORDS):
+            self.lookup[keyword] = -1 - priority
+        self.withdrawal_types = list(WITHDRAWAL_KEYWORDS.values())
+        self.pattern = re.compile(rf"\b{_trie_pattern(self.lookup, [YEARS_PATTERN])}\b")
+
+    def extract(self, text: str) -> Dict:
+        """Return the profile fields mentioned in text (only the ones found)."""
+        lookup = self.lookup
+        flags = 0
+        years = None
+        withdrawal_rank = 0
+        text = text.lower()
+        for token in self.pattern.findall(text):
+            value = lookup.get(token)
+            if value is None:
+                # Only the years branch produces tokens outside the lookup, e.g. "10 years"
+                if years is None:
+                    years = int(token.partition("y")[0])
+            elif value > 0:
+                flags |= value
+            elif not withdrawal_rank or value > withdrawal_rank:
+                withdrawal_rank = value
+
+        fields = {}
+        if flags & CONTRIBUTION_TOPIC:
+            if flags & AFFIRMATION:
+                fields["pf_contribution"] = "active"
+            elif flags & NEGATION:
+                fields["pf_contribution"] = "inactive"
+        if years is not None:
+            fields["service_years"] = years
+        if withdrawal_rank:
+            fields["withdrawal_type"] = self.withdrawal_types[-1 - withdrawal_rank]
+        if flags & WITHDRAWAL_TOPIC:
+            fields["previous_withdrawals"] = "none" if flags & WITHDRAWAL_NEGATION else "yes"
+        if flags & (BALANCE_TOPIC | WAGE_TOPIC):
+            # Rare enough that a second pass, only over messages that mention a cue, is cheapest
+            for cue, number, unit in AMOUNT_PATTERN.findall(text):
+                amount = parse_amount(number, unit)
+                if amount is not None:
+                    fields.setdefault(AMOUNT_FIELDS.get(cue, "basic_wage"), amount)
+        return fields
+
+    def extract_many(self, texts: Iterable[str]) -> List[Dict]:
+        """Extract fields from many messages, e.g. archived chat logs."""
+        extract = self.extract
+        return [extract(text) for text in texts]
+
+
+PROFILE_EXTRACTOR = ProfileExtractor()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+VECTOR_DIM = 4096
+
+# Words that appear in nearly every PF question and carry no topic signal
+STOPWORDS = {
+    "a", "about", "am", "an", "and", "any", "are", "as", "at", "be", "can", "could", "do", "does", "for",
+    "from", "get", "have", "how", "i", "if", "in", "is", "it", "me", "much", "my", "of", "on", "or",
+    "pf", "please", "the", "to", "use", "want", "what", "when", "which", "will", "with", "withdraw",
+    "withdrawal", "withdrawing", "you", "your",
+}
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _features(text: str) -> List[str]:
+    """Words plus character 4-grams, so inflections ("married"/"marriage") still overlap."""
+    features = []
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        features.append(word)
+        padded = f"<{word}>"
+        features.extend(padded[i:i + 4] for i in range(len(padded) - 3))
+    return features
+
+
+def _hashed_counts(text: str) -> np.ndarray:
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for feature in _features(text):
+        # crc32 is stable across processes, unlike hash(), so saved indexes stay valid
+        vector[zlib.crc32(feature.encode("utf-8")) % VECTOR_DIM] += 1.0
+    return np.log1p(vector)
+
+
+def load_corpus_file(path: str) -> List[Dict]:
+    """Read extra corpus entries ({"id", "title", "text", "answer"}) from a JSON file."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FAQIndex:
+    """Hashed TF-IDF vectors for a small FAQ corpus, searched with one matrix-vector product.
+
+    Queries scoring at least `answer_threshold`, and at least `answer_margin` ahead
+    of the runner-up, can be answered straight from the corpus; scores above
+    `context_threshold` are good enough to hand the top snippets to the model.
+    """
+
+    def __init__(self, entries: List[Dict], matrix: np.ndarray, idf: np.ndarray, corpus_hash: str,
+                 answer_threshold: float = 0.25, answer_margin: float = 0.1, context_threshold: float = 0.15):
+        self.entries = entries
+        self.matrix = matrix
+        self.idf = idf
+        self.corpus_hash = corpus_hash
+        self.answer_threshold = answer_threshold
+        self.answer_margin = answer_margin
+        self.context_threshold = context_threshold
+
+    @staticmethod
+    def corpus_hash_of(entries: List[Dict]) -> str:
+        raw = json.dumps([[e["id"], e["text"], e["answer"]] for e in entries], sort_keys=True)
+        return hashlib.sha256(f"{VECTOR_DIM}:{raw}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def build(cls, entries: List[Dict], **thresholds) -> "FAQIndex":
+        """Vectorize every entry's search text."""
+        counts = np.stack([_hashed_counts(entry["text"]) for entry in entries])
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1 + len(entries)) / (1 + document_frequency)).astype(np.float32) + 1.0
+        matrix = counts * idf
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9)
+        return cls(entries, matrix.astype(np.float32), idf, cls.corpus_hash_of(entries), **thresholds)
+
+    def save(self, path: str):
+        """Persist vectors and entries to a .npz file."""
+        np.savez_compressed(
+            path,
+            matrix=self.matrix,
+            idf=self.idf,
+            entries=np.array(json.dumps(self.entries)),
+            corpus_hash=np.array(self.corpus_hash),
+        )
+
+    @classmethod
+    def load(cls, path: str, **thresholds) -> "FAQIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(json.loads(str(data["entries"])), data["matrix"], data["idf"],
+                       str(data["corpus_hash"]), **thresholds)
+
+    @classmethod
+    def load_or_build(cls, entries: List[Dict], path: Optional[str] = None, **thresholds) -> "FAQIndex":
+        """Load the saved index if it matches the corpus; otherwise rebuild and try to save it."""
+        if path and os.path.exists(path):
+            try:
+                index = cls.load(path, **thresholds)
+                if index.corpus_hash == cls.corpus_hash_of(entries):
+                    return index
+            except (OSError, ValueError, KeyError):
+                pass
+        index = cls.build(entries, **thresholds)
+        if path:
+            try:
+                index.save(path)
+            except OSError:
+                # A read-only deployment still works with the in-memory index
+                pass
+        return index
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, Dict]]:
+        """Return the k best (score, entry) pairs by cosine similarity."""
+        vector = _hashed_counts(query) * self.idf
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return []
+        scores = self.matrix @ (vector / norm)
+        top = np.argsort(scores)[::-1][:k]
+        return [(float(scores[i]), self.entries[i]) for i in top]
+
+    def decide(self, hits: List[Tuple[float, Dict]]) -> Optional[str]:
+        """Return "answer" for a confident, unambiguous match, "context" for a relevant one, else None."""
+        if not hits or hits[0][0] < self.context_threshold:
+            return None
+        runner_up = hits[1][0] if len(hits) > 1 else 0.0
+        if hits[0][0] >= self.answer_threshold and hits[0][0] - runner_up >= self.answer_margin:
+            return "answer"
+        return "context"
+
+    def snippets(self, hits: List[Tuple[float, Dict]]) -> List[str]:
+        """Answers of the hits that clear the context threshold."""
+        return [entry["answer"] for score, entry in hits if score >= self.context_threshold]
@@ -0,0 +1,363 @@
+"""Concurrent-user load test for PF Bot against the local stub model.
+
+Each simulated user fills in the intake form, asks a few follow-up questions and
+clicks a Quick Reference card, the same flow app.py serves.
+
+Usage:
+    python loadtest.py threads [--users 100] [--latency 0.5] [--tps 200] [--think 0]
+    python loadtest.py asyncio [--users 500] [--latency 0.5] [--tps 200]
+    python loadtest.py app [--users 20] [--latency 0.5] [--tps 200]
+
+"threads" drives PFBot from one thread per user, like Streamlit's script threads;
+"asyncio" serves every user on one event loop; "app" runs the real app.py through
+Streamlit's testing API, one AppTest per user, interleaving their reruns.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from backends import StubBackend
+from bench import CONVERSATION_SCRIPTS, _percentile
+from cache import ResponseCache
+from session_store import SessionStore
+from Work import QUICK_ANSWERS, PFBot, PFEngine
+
+# Intake-form answers, cycled over the simulated users
+INTAKE_ANSWERS = [
+    {
+        "pf_contribution": "Yes, I'm still employed and contributing to my PF.",
+        "service_years": "12 years",
+        "withdrawal_type": "Partial, to repay my home loan",
+        "previous_withdrawals": "No",
+    },
+    {
+        "pf_contribution": "No, I'm not contributing currently.",
+        "service_years": "4 years",
+        "withdrawal_type": "Full withdrawal, I am unemployed",
+        "previous_withdrawals": "Yes, for medical treatment",
+    },
+    {
+        "pf_contribution": "Yes, I'm still employed and contributing to my PF.",
+        "service_years": "6 years",
+        "withdrawal_type": "For my sister's wedding",
+        "previous_withdrawals": "Never",
+    },
+]
+FOLLOW_UPS = 3
+
+
+class CountingBackend(StubBackend):
+    """Stub backend that tracks how many model calls are in flight at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self._count_lock = threading.Lock()
+
+    def _enter(self):
+        with self._count_lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._count_lock:
+            self.in_flight -= 1
+
+    def generate_content(self, prompt: str, stream: bool = False, system_instruction=None, timeout=None):
+        if stream:
+            return self._counted_stream(prompt, system_instruction, timeout)
+        self._enter()
+        try:
+            return super().generate_content(prompt, False, system_instruction, timeout)
+        finally:
+            self._exit()
+
+    def _counted_stream(self, prompt: str, system_instruction, timeout):
+        # Counted from the first next() until the stream is exhausted or closed
+        self._enter()
+        try:
+            yield from super().generate_content(prompt, True, system_instruction, timeout)
+        finally:
+            self._exit()
+
+    async def generate_content_async(self, prompt: str, system_instruction=None, timeout=None):
+        self._enter()
+        try:
+            return await super().generate_content_async(prompt, system_instruction, timeout)
+        finally:
+            self._exit()
+
+
+def user_script(user: int) -> Dict:
+    """The intake answers, follow-up questions and quick card for one simulated user."""
+    conversation = CONVERSATION_SCRIPTS[user % len(CONVERSATION_SCRIPTS)]
+    # Tag follow-ups with the user so they miss the shared response cache, as real questions mostly do
+    follow_ups = [f"{message} (user {user})" for message in conversation[-FOLLOW_UPS:]]
+    cards = list(QUICK_ANSWERS)
+    return {
+        "intake": INTAKE_ANSWERS[user % len(INTAKE_ANSWERS)],
+        "follow_ups": follow_ups,
+        "card": cards[user % len(cards)],
+    }
+
+
+class Recorder:
+    """Thread-safe collection of turn latencies by kind, plus error counts."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, elapsed: float, failed: bool = False):
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+            self.errors += failed
+
+
+class Sampler:
+    """Background thread sampling live thread count and process CPU while the test runs."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_threads = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.wall = time.perf_counter() - self.wall_start
+        self.cpu = time.process_time() - self.cpu_start
+
+
+def _failed(answer: str) -> bool:
+    return answer.startswith("I apologize") or answer.startswith("I can't reach")
+
+
+def _build_engine(args, store: Optional[SessionStore]) -> PFEngine:
+    backend = CountingBackend(latency=args.latency, tokens_per_second=args.tps,
+                              failure_rate=args.failure_rate, seed=0)
+    return PFEngine(cache=ResponseCache(), backend=backend, session_store=store)
+
+
+def run_user_sync(engine: PFEngine, store: SessionStore, user: int, recorder: Recorder, think: float):
+    script = user_script(user)
+    bot = PFBot(engine=engine, session=store.get(f"load-{user}"))
+    start = time.perf_counter()
+    answer = bot.get_personalized_withdrawal_advice(script["intake"])
+    bot.record_message("assistant", answer)
+    recorder.add("intake", time.perf_counter() - start, _failed(answer))
+    for message in script["follow_ups"]:
+        time.sleep(think * random.uniform(0.5, 1.5))
+        start = time.perf_counter()
+        answer = "".join(bot.stream_response(message))
+        recorder.add("follow_up", time.perf_counter() - start, _failed(answer))
+    start = time.perf_counter()
+    bot.record_message("user", f"Tell me about {script['card']}")
+    bot.record_message("assistant", QUICK_ANSWERS[script["card"]])
+    recorder.add("card", time.perf_counter() - start)
+
+
+async def run_user_async(engine: PFEngine, store: SessionStore, user: int, recorder: Recorder, think: float):
+    script = user_script(user)
+    bot = PFBot(engine=engine, session=store.get(f"load-{user}"))
+    start = time.perf_counter()
+    answer = await bot.get_personalized_withdrawal_advice_async(script["intake"])
+    bot.record_message("assistant", answer)
+    recorder.add("intake", time.perf_counter() - start, _failed(answer))
+    for message in script["follow_ups"]:
+        await asyncio.sleep(think * random.uniform(0.5, 1.5))
+        start = time.perf_counter()
+        answer = await bot.get_response_async(message)
+        recorder.add("follow_up", time.perf_counter() - start, _failed(answer))
+    start = time.perf_counter()
+    bot.record_message("user", f"Tell me about {script['card']}")
+    bot.record_message("assistant", QUICK_ANSWERS[script["card"]])
+    recorder.add("card", time.perf_counter() - start)
+
+
+async def _loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01):
+    # How late a short sleep wakes up is how long the loop was busy with other work
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+def app_user_steps(user: int, recorder: Recorder, timeout: float) -> Iterator[None]:
+    """Drive one user through app.py, yielding after every rerun so users can be interleaved."""
+    from streamlit.testing.v1 import AppTest
+
+    script = user_script(user)
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"),
+                            default_timeout=timeout)
+    app.query_params["sid"] = f"load-app-{user}"
+    start = time.perf_counter()
+    app.run()
+    recorder.add("page_load", time.perf_counter() - start, bool(app.exception))
+    yield
+
+    intake = script["intake"]
+    app.text_input[0].set_value(intake["service_years"])
+    app.text_input[1].set_value(intake["withdrawal_type"])
+    app.text_input[2].set_value(intake["previous_withdrawals"])
+    start = time.perf_counter()
+    app.button(key="submit_personal").click().run()
+    recorder.add("intake", time.perf_counter() - start, bool(app.exception))
+    yield
+    for message in script["follow_ups"]:
+        start = time.perf_counter()
+        app.text_input(key="chat_input").set_value(message).run()
+        recorder.add("follow_up", time.perf_counter() - start, bool(app.exception))
+        yield
+    start = time.perf_counter()
+    app.button(key=f"purpose_{script['card']}").click().run()
+    recorder.add("card", time.perf_counter() - start, bool(app.exception))
+
+
+def _configure_app_env(args, db_path: str):
+    # app.py builds its engine from the environment; point it at the stub and a scratch store
+    os.environ["PFBOT_BACKEND"] = "stub"
+    os.environ["PFBOT_STUB_LATENCY"] = str(args.latency)
+    os.environ["PFBOT_STUB_TPS"] = str(args.tps)
+    os.environ["PFBOT_STUB_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["PFBOT_SESSION_DB"] = db_path
+
+
+def report(mode: str, args, recorder: Recorder, sampler: Sampler, memory_per_session: Optional[float],
+           extra: Dict[str, str]):
+    turns = sum(len(values) for values in recorder.latencies.values())
+    print(f"{mode}: {args.users} users, stub latency {args.latency}s, {args.tps:g} tok/s, think {args.think}s")
+    print(f"wall {sampler.wall:.2f}s, {turns} turns, {turns / sampler.wall:.1f} turns/s, "
+          f"{args.users / sampler.wall:.1f} sessions/s, {recorder.errors} errors")
+    print(f"{'kind':<10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, values in recorder.latencies.items():
+        print(f"{kind:<10} {len(values):>6} {_percentile(values, 0.50) * 1000:9.1f} "
+              f"{_percentile(values, 0.95) * 1000:9.1f} {_percentile(values, 0.99) * 1000:9.1f} "
+              f"{max(values) * 1000:9.1f}")
+    if memory_per_session is not None:
+        print(f"memory per session: {memory_per_session / 1024:.1f} KiB (traced)")
+    print(f"cpu {sampler.cpu:.2f}s ({sampler.cpu / sampler.wall:.0%} of one core), "
+          f"peak threads {sampler.peak_threads}")
+    for label, value in extra.items():
+        print(f"{label}: {value}")
+
+
+def load_threads(args):
+    with tempfile.TemporaryDirectory() as scratch:
+        store = SessionStore(os.path.join(scratch, "sessions.db"), max_hot=args.users)
+        engine = _build_engine(args, store)
+        recorder = Recorder()
+        if args.trace_memory:
+            tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+        with Sampler() as sampler, ThreadPoolExecutor(max_workers=args.users) as pool:
+            futures = [pool.submit(run_user_sync, engine, store, user, recorder, args.think)
+                       for user in range(args.users)]
+            for future in futures:
+                future.result()
+        memory = None
+        if args.trace_memory:
+            memory = (tracemalloc.get_traced_memory()[0] - baseline) / args.users
+            tracemalloc.stop()
+        backend = engine.backend
+        report("threads", args, recorder, sampler, memory, {
+            "model calls": f"{backend.calls}, peak in flight {backend.peak_in_flight}",
+        })
+
+
+def load_asyncio(args):
+    with tempfile.TemporaryDirectory() as scratch:
+        store = SessionStore(os.path.join(scratch, "sessions.db"), max_hot=args.users)
+        engine = _build_engine(args, store)
+        recorder = Recorder()
+        lag: List[float] = []
+
+        async def run_all():
+            stop = asyncio.Event()
+            monitor = asyncio.create_task(_loop_lag(lag, stop))
+            await asyncio.gather(*(run_user_async(engine, store, user, recorder, args.think)
+                                   for user in range(args.users)))
+            stop.set()
+            await monitor
+
+        if args.trace_memory:
+            tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+        with Sampler() as sampler:
+            asyncio.run(run_all())
+        memory = None
+        if args.trace_memory:
+            memory = (tracemalloc.get_traced_memory()[0] - baseline) / args.users
+            tracemalloc.stop()
+        backend = engine.backend
+        report("asyncio", args, recorder, sampler, memory, {
+            "model calls": f"{backend.calls}, peak in flight {backend.peak_in_flight}",
+            "event-loop lag": f"p50 {_percentile(lag, 0.5) * 1000:.1f} ms, p99 {_percentile(lag, 0.99) * 1000:.1f} ms, "
+                              f"max {max(lag) * 1000:.1f} ms" if lag else "n/a",
+        })
+
+
+def load_app(args):
+    # AppTest installs a process-global runtime for the duration of each run, so reruns
+    # cannot overlap; users are interleaved one rerun at a time with all sessions live
+    with tempfile.TemporaryDirectory() as scratch:
+        _configure_app_env(args, os.path.join(scratch, "sessions.db"))
+        recorder = Recorder()
+        if args.trace_memory:
+            tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+        with Sampler() as sampler:
+            users = [app_user_steps(user, recorder, args.timeout) for user in range(args.users)]
+            while users:
+                for steps in list(users):
+                    if next(steps, StopIteration) is StopIteration:
+                        users.remove(steps)
+        memory = None
+        if args.trace_memory:
+            memory = (tracemalloc.get_traced_memory()[0] - baseline) / args.users
+            tracemalloc.stop()
+        report("app", args, recorder, sampler, memory, {
+            "reruns": "serialized (AppTest limitation)",
+            "note": "per-session memory includes each AppTest's element tree",
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PF Bot concurrent-user load test (stub model)")
+    parser.add_argument("mode", choices=["threads", "asyncio", "app"])
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated sessions")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub time to first token (s)")
+    parser.add_argument("--tps", type=float, default=200, help="stub tokens per second (0 = instant)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of stub calls that fail")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a user's turns (s; threads and asyncio modes)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-run AppTest timeout (app mode)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="measure per-session memory with tracemalloc (slows the run)")
+    args = parser.parse_args()
+    {"threads": load_threads, "asyncio": load_asyncio, "app": load_app}[args.mode](args)
+
+
+if __name__ == "__main__":
+    main()
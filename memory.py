@@ -0,0 +1,97 @@
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def extractive_summary(previous_summary: str, turns: List[Dict]) -> str:
+    """Fold turns into the summary by keeping the first sentence of each message."""
+    lines = [previous_summary] if previous_summary else []
+    for turn in turns:
+        content = " ".join(turn["content"].split())
+        first_sentence = content.split(". ")[0][:160]
+        lines.append(f"- {turn['role']}: {first_sentence}")
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """Token-budgeted chat memory: recent turns verbatim, older turns folded into a summary."""
+
+    __slots__ = ("max_tokens", "max_verbatim_turns", "summarizer", "summary", "_turns", "_lines", "_text", "_tokens")
+
+    def __init__(
+        self,
+        max_tokens: int = 800,
+        max_verbatim_turns: int = 6,
+        summarizer: Optional[Callable[[str, List[Dict]], str]] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.max_verbatim_turns = max_verbatim_turns
+        self.summarizer = summarizer or extractive_summary
+        self.summary = ""
+        self._turns: Deque[Dict] = deque()
+        self._lines: Deque[str] = deque()
+        self._text = ""
+        self._tokens = 0
+
+    def add(self, role: str, content: str):
+        """Append a turn and fold the oldest ones once the window or budget is exceeded."""
+        line = f"{role}: {content}\n"
+        self._turns.append({"role": role, "content": content})
+        self._lines.append(line)
+        self._text += line
+        self._tokens += estimate_tokens(line)
+        self._fold()
+
+    def _fold(self):
+        evicted = []
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.max_verbatim_turns
+            or self._tokens + estimate_tokens(self.summary) > self.max_tokens
+        ):
+            line = self._lines.popleft()
+            self._text = self._text[len(line):]
+            self._tokens -= estimate_tokens(line)
+            evicted.append(self._turns.popleft())
+        if evicted:
+            self.summary = self._trim_summary(self.summarizer(self.summary, evicted))
+
+    def _trim_summary(self, summary: str) -> str:
+        # The summary gets at most a quarter of the budget; the oldest lines go first
+        limit = self.max_tokens // 4
+        lines = summary.split("\n")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > limit:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def render(self) -> str:
+        """Return the summary followed by the verbatim turns, ready for a prompt."""
+        if not self.summary:
+            return self._text
+        return f"Summary of earlier conversation:\n{self.summary}\n\nRecent messages:\n{self._text}"
+
+    def token_count(self) -> int:
+        """Estimated tokens render() will contribute to a prompt."""
+        return estimate_tokens(self.render())
+
+    def to_dict(self) -> Dict:
+        """Serializable snapshot of the summary and the verbatim turns."""
+        return {"summary": self.summary, "turns": list(self._turns)}
+
+    def restore(self, state: Dict):
+        """Replace the contents with a snapshot produced by to_dict()."""
+        self.clear()
+        self.summary = state.get("summary", "")
+        for turn in state.get("turns", []):
+            self.add(turn["role"], turn["content"])
+
+    def clear(self):
+        """Forget the summary and all turns."""
+        self.summary = ""
+        self._turns.clear()
+        self._lines.clear()
+        self._text = ""
+        self._tokens = 0
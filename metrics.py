@@ -0,0 +1,188 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds; wide enough for both local steps (µs) and model calls (s)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict]) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, compatible with the Prometheus exposition format."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms with optional per-observation hooks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._hooks: List[Callable[[Dict], None]] = []
+
+    def add_hook(self, hook: Callable[[Dict], None]):
+        """Call hook(event) for every recorded value, e.g. to forward to a log pipeline."""
+        self._hooks.append(hook)
+
+    def _emit(self, kind: str, name: str, value: float, labels: Optional[Dict]):
+        if not self._hooks:
+            return
+        event = {"ts": time.time(), "kind": kind, "name": name, "value": value, "labels": labels or {}}
+        for hook in self._hooks:
+            hook(event)
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, labels: Optional[Dict] = None):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        self._emit("counter", name, value, labels)
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict] = None):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+        self._emit("gauge", name, value, labels)
+
+    def observe(self, name: str, value: float, labels: Optional[Dict] = None, buckets=LATENCY_BUCKETS):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+        self._emit("histogram", name, value, labels)
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[Dict] = None):
+        """Observe the wall time of the with-block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def snapshot(self) -> Dict:
+        """Plain-dict view of every series, for JSON export and the debug panel."""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._gauges.items()
+                },
+                "histograms": {
+                    name: [
+                        {"labels": dict(key), "count": h.count, "sum": h.sum,
+                         "mean": h.sum / h.count if h.count else 0.0,
+                         "buckets": dict(zip([*map(str, h.buckets), "+Inf"], h.counts))}
+                        for key, h in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(store.items()):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_jsonl(self, path: str):
+        """Append one timestamped snapshot line to a JSON lines file."""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"ts": time.time(), **self.snapshot()}) + "\n")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def usage_counts(response) -> Tuple[int, int]:
+    """Prompt and response token counts from a model response's usage metadata, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_token_count", 0) or 0, usage.get("candidates_token_count", 0) or 0
+    return getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("pfbot_profile_extraction_seconds", "Time spent extracting profile fields from a message")
+METRICS.describe("pfbot_prompt_build_seconds", "Time spent assembling a prompt")
+METRICS.describe("pfbot_model_call_seconds", "Wall time of model calls")
+METRICS.describe("pfbot_first_chunk_seconds", "Time to the first streamed chunk")
+METRICS.describe("pfbot_prompt_bytes", "Size of the per-turn prompt text sent to the model")
+METRICS.describe("pfbot_static_prefix_bytes_total", "Bytes of static instructions sent via the system-instruction channel")
+METRICS.describe("pfbot_request_bytes", "Total bytes sent per model call: system instruction plus per-turn prompt")
+METRICS.describe("pfbot_prompt_tokens_total", "Prompt tokens reported by the model")
+METRICS.describe("pfbot_response_tokens_total", "Response tokens reported by the model")
+METRICS.describe("pfbot_errors_total", "Model call failures by exception type")
+METRICS.describe("pfbot_answers_total", "Answers served, by source (model, cache, local rules/FAQ, static fallback)")
+METRICS.describe("pfbot_conversation_messages", "Conversation length in messages after each answer")
+METRICS.describe("pfbot_retries_total", "Model call attempts retried after a retryable error")
+METRICS.describe("pfbot_coalesced_calls_total", "Model calls served by joining an identical in-flight call")
+METRICS.describe("pfbot_circuit_rejections_total", "Model calls rejected because the circuit breaker was open")
+METRICS.describe("pfbot_circuit_open", "1 while the model circuit breaker is open")
+METRICS.describe("pfbot_flow_turns_total", "Chat turns answered by the conversation flow (intake templates, speculative answers)")
+METRICS.describe("pfbot_speculations_total", "Speculative final answers by outcome (started, used, missed)")
+METRICS.describe("pfbot_batch_size", "Requests per micro-batch sent to the model")
+METRICS.describe("pfbot_batch_queue_seconds", "Time a request waited for its micro-batch to be sent")
+METRICS.describe("pfbot_batch_fallbacks_total", "Batched requests answered by a separate call because the batch reply lacked them")
@@ -0,0 +1,130 @@
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+from metrics import COUNT_BUCKETS, METRICS, MetricsRegistry
+
+T = TypeVar("T")
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+
+def parse_batch_answers(text: str, ids: Sequence[str]) -> Dict[str, str]:
+    """Answers by request id from a model reply holding a JSON array of {"id", "answer"} objects.
+
+    Entries with unknown ids or empty answers are dropped; an unparsable reply yields {}.
+    """
+    text = _FENCE.sub("", text.strip())
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return {}
+    try:
+        entries = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    wanted = set(ids)
+    answers = {}
+    for entry in entries if isinstance(entries, list) else ():
+        if not isinstance(entry, dict):
+            continue
+        request_id, answer = str(entry.get("id", "")), entry.get("answer")
+        if request_id in wanted and isinstance(answer, str) and answer.strip():
+            answers[request_id] = answer.strip()
+    return answers
+
+
+class _Pending(Generic[T]):
+    __slots__ = ("item", "future", "enqueued")
+
+    def __init__(self, item: T):
+        self.item = item
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+
+
+class MicroBatcher(Generic[T]):
+    """Groups requests arriving within `window` seconds, up to `max_size`, into one call.
+
+    run_batch([(id, item), ...]) returns answers by id; any item it leaves out (e.g. because
+    the reply could not be parsed) is answered by run_one(item) instead. A lone request goes
+    straight to run_one. Errors from run_batch are raised to every caller in the batch.
+    Callers that cancelled their future (e.g. on a timeout) are skipped.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Tuple[str, T]]], Dict[str, str]],
+                 run_one: Callable[[T], str], window: float = 0.05, max_size: int = 8,
+                 workers: int = 4, name: str = "batch", metrics: Optional[MetricsRegistry] = None):
+        self.run_batch = run_batch
+        self.run_one = run_one
+        self.window = window
+        self.max_size = max_size
+        self.workers = workers
+        self.labels = {"batcher": name}
+        self.metrics = metrics if metrics is not None else METRICS
+        self._queue: "queue.SimpleQueue[_Pending[T]]" = queue.SimpleQueue()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: T) -> Future:
+        """Queue item for the next batch; the returned future resolves to its answer."""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # Batches are sent from a pool so the next one can fill while one is in flight
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="pfbot-batch")
+                    threading.Thread(target=self._collect, name="pfbot-batch-collector", daemon=True).start()
+        pending = _Pending(item)
+        self._queue.put(pending)
+        return pending.future
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.window
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[_Pending[T]]):
+        # Claim every future up front; a cancelled one must not stop the rest being resolved
+        batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        now = time.monotonic()
+        for pending in batch:
+            self.metrics.observe("pfbot_batch_queue_seconds", now - pending.enqueued, self.labels)
+        self.metrics.observe("pfbot_batch_size", len(batch), self.labels, buckets=COUNT_BUCKETS)
+        if len(batch) == 1:
+            self._run_one(batch[0])
+            return
+        try:
+            answers = self.run_batch([(str(i), pending.item) for i, pending in enumerate(batch)])
+        except Exception as e:
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        for i, pending in enumerate(batch):
+            answer = answers.get(str(i))
+            if answer is not None:
+                pending.future.set_result(answer)
+                continue
+            # Missing or unparsable entries are answered one by one, in parallel
+            self.metrics.inc("pfbot_batch_fallbacks_total", labels=self.labels)
+            self._pool.submit(self._run_one, pending)
+
+    def _run_one(self, pending: _Pending[T]):
+        # The future is already running, so it can no longer be cancelled under us
+        try:
+            pending.future.set_result(self.run_one(pending.item))
+        except Exception as e:
+            pending.future.set_exception(e)
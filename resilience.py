@@ -0,0 +1,231 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from metrics import METRICS, MetricsRegistry
+
+T = TypeVar("T")
+
+# Upstream errors worth another attempt: rate limits, overload and deadlines. Matched by
+# class name so the Gemini client's exception types need not be importable here.
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "BadGateway", "StubBackendError",
+}
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed model call may succeed if tried again."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive retryable failures and fails fast for
+    `reset_seconds`; then lets a single trial call through (half-open) to probe recovery.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class ResilientCaller:
+    """Wraps model calls with request coalescing, retries, per-attempt deadlines and a circuit breaker.
+
+    Concurrent calls with the same key share one upstream call (singleflight). Retryable
+    failures are retried up to `retries` times with full-jitter exponential backoff, each
+    attempt bounded by `attempt_timeout` and all of them by the caller's overall deadline.
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, retries: int = 2, backoff: float = 0.25,
+                 max_backoff: float = 4.0, attempt_timeout: Optional[float] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.attempt_timeout = attempt_timeout
+        self.metrics = metrics if metrics is not None else METRICS
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._async_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = weakref.WeakKeyDictionary()
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _attempt_timeout(self, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return self.attempt_timeout
+        remaining = max(0.0, deadline - time.monotonic())
+        return remaining if self.attempt_timeout is None else min(self.attempt_timeout, remaining)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.metrics.inc("pfbot_circuit_rejections_total")
+            raise CircuitOpenError("The model is temporarily unavailable (circuit open)")
+
+    def _after_failure(self, error: BaseException, attempt: int, deadline: Optional[float]) -> Optional[float]:
+        """Record a failed attempt; return the backoff delay, or None if it should not be retried."""
+        if not is_retryable(error):
+            # The upstream answered (e.g. a bad request), so it is healthy as far as the breaker cares
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        self.metrics.set_gauge("pfbot_circuit_open", 1 if self.breaker.state == CircuitBreaker.OPEN else 0)
+        delay = self._delay(attempt)
+        if attempt >= self.retries or (deadline is not None and time.monotonic() + delay >= deadline):
+            return None
+        self.metrics.inc("pfbot_retries_total", labels={"type": type(error).__name__})
+        return delay
+
+    def _after_success(self):
+        self.breaker.record_success()
+        self.metrics.set_gauge("pfbot_circuit_open", 0)
+
+    def call(self, fn: Callable[[Optional[float]], T], key: Optional[Hashable] = None,
+             timeout: Optional[float] = None) -> T:
+        """Run fn(attempt_timeout) with retries; callers passing the same key share one run."""
+        if key is None:
+            return self._call(fn, timeout)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self.metrics.inc("pfbot_coalesced_calls_total")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self._call(fn, timeout)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _call(self, fn: Callable[[Optional[float]], T], timeout: Optional[float]) -> T:
+        deadline = time.monotonic() + timeout if timeout else None
+        attempt = 0
+        while True:
+            self._admit()
+            try:
+                result = fn(self._attempt_timeout(deadline))
+            except Exception as e:
+                delay = self._after_failure(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._after_success()
+            return result
+
+    async def call_async(self, fn: Callable[[Optional[float]], Awaitable[T]], key: Optional[Hashable] = None,
+                         timeout: Optional[float] = None, limiter: Optional[asyncio.Semaphore] = None) -> T:
+        """Async counterpart of call(); coalescing is per event loop.
+
+        Each attempt holds a slot of `limiter`, if given, while it runs. Time spent waiting for
+        the slot counts only against the overall deadline, and running out of time there is
+        neither retried nor held against the upstream by the breaker.
+        """
+        if key is None:
+            return await self._call_async(fn, timeout, limiter)
+        loop = asyncio.get_running_loop()
+        flights = self._async_flights.setdefault(loop, {})
+        task = flights.get(key)
+        if task is not None:
+            self.metrics.inc("pfbot_coalesced_calls_total")
+            # shield() keeps one waiter's cancellation from cancelling the shared call
+            return await asyncio.shield(task)
+        task = flights[key] = loop.create_task(self._call_async(fn, timeout, limiter))
+        task.add_done_callback(lambda _: flights.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _call_async(self, fn: Callable[[Optional[float]], Awaitable[T]], timeout: Optional[float],
+                          limiter: Optional[asyncio.Semaphore] = None) -> T:
+        deadline = time.monotonic() + timeout if timeout else None
+        attempt = 0
+        while True:
+            if limiter is not None:
+                # Queueing for a local slot happens before the attempt's own deadline starts
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                await asyncio.wait_for(limiter.acquire(), remaining)
+            try:
+                self._admit()
+                attempt_timeout = self._attempt_timeout(deadline)
+                try:
+                    # wait_for cancels an attempt that overruns its deadline
+                    result = await asyncio.wait_for(fn(attempt_timeout), attempt_timeout)
+                except Exception as e:
+                    delay = self._after_failure(e, attempt, deadline)
+                    if delay is None:
+                        raise
+                else:
+                    self._after_success()
+                    return result
+            finally:
+                if limiter is not None:
+                    limiter.release()
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from memory import ConversationMemory
+
+MEMORY_TOKENS = int(os.getenv("PFBOT_MEMORY_TOKENS", "800"))
+
+
+def new_user_profile() -> Dict:
+    """Return an empty user profile."""
+    return {
+        "pf_contribution": None,
+        "service_years": None,
+        "withdrawal_type": None,
+        "previous_withdrawals": None,
+        "current_balance": None,
+        "basic_wage": None
+    }
+
+
+@dataclass(slots=True)
+class SessionState:
+    """Per-conversation state: the profile, the history and the prompt memory."""
+    user_profile: Dict = field(default_factory=new_user_profile)
+    conversation_history: List[Dict] = field(default_factory=list)
+    memory: ConversationMemory = field(default_factory=lambda: ConversationMemory(max_tokens=MEMORY_TOKENS))
+    conversation_state: str = "initial"  # Track conversation flow
+    pending_questions: List[str] = field(default_factory=list)  # Questions to ask user
+    session_id: Optional[str] = None  # Set when the session is backed by a SessionStore
+    message_count: int = 0  # Total messages, including older ones not held in memory
+    speculation_token: Optional[str] = None  # Ties a speculative final answer to this session
+
+    def reset(self):
+        """Forget the profile and the conversation."""
+        self.user_profile = new_user_profile()
+        self.conversation_history = []
+        self.memory.clear()
+        self.conversation_state = "initial"
+        self.pending_questions = []
+        self.message_count = 0
+        self.speculation_token = None
+
+
+class SessionStore:
+    """SQLite-backed (WAL) session persistence with a bounded in-memory LRU of hot sessions.
+
+    Every message is written through as it happens, so evicting a session only
+    drops it from memory; the next get() rehydrates it from disk.
+    """
+
+    def __init__(self, db_path: str, max_hot: int = 1000, idle_seconds: float = 1800, history_window: int = 50):
+        self.db_path = db_path
+        self.max_hot = max_hot
+        self.idle_seconds = idle_seconds
+        # Only the most recent messages stay in memory; older ones are paged from disk
+        self.history_window = history_window
+        self._hot: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    profile TEXT NOT NULL,
+                    conversation_state TEXT NOT NULL,
+                    pending_questions TEXT NOT NULL,
+                    memory TEXT NOT NULL,
+                    message_count INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                );
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets Streamlit workers read while another writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> SessionState:
+        """Return the hot session, rehydrating it from disk or creating it as needed."""
+        now = time.time()
+        with self._lock:
+            entry = self._hot.pop(session_id, None)
+            if entry is not None:
+                self._hot[session_id] = (entry[0], now)
+                return entry[0]
+
+        session = self._load(session_id) or SessionState(session_id=session_id)
+        with self._lock:
+            # Another thread may have loaded it meanwhile; keep the first copy
+            entry = self._hot.pop(session_id, None)
+            if entry is not None:
+                session = entry[0]
+            self._hot[session_id] = (session, now)
+        self.evict()
+        return session
+
+    def _load(self, session_id: str) -> Optional[SessionState]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT profile, conversation_state, pending_questions, memory, message_count "
+            "FROM sessions WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        session = SessionState(
+            # Fields added since the row was written start out empty
+            user_profile={**new_user_profile(), **json.loads(row[0])},
+            conversation_state=row[1],
+            pending_questions=json.loads(row[2]),
+            session_id=session_id,
+            message_count=row[4],
+        )
+        session.memory.restore(json.loads(row[3]))
+        session.conversation_history = self.load_messages(session_id, limit=self.history_window)
+        return session
+
+    def load_messages(self, session_id: str, limit: int = 50, before: Optional[int] = None) -> List[Dict]:
+        """Messages in order, the `limit` most recent ones before message number `before`."""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT seq, role, content FROM messages WHERE session_id = ? AND seq < ? "
+            "ORDER BY seq DESC LIMIT ?",
+            (session_id, before if before is not None else 2 ** 62, limit),
+        ).fetchall()
+        return [{"role": role, "content": content, "seq": seq} for seq, role, content in reversed(rows)]
+
+    def append_message(self, session: SessionState, message: Dict):
+        """Persist one new message together with the session's current state."""
+        message["seq"] = session.message_count
+        session.message_count += 1
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                (session.session_id, message["seq"], message["role"], message["content"]),
+            )
+            self._write_state(conn, session)
+        if len(session.conversation_history) > self.history_window:
+            del session.conversation_history[:-self.history_window]
+
+    def save(self, session: SessionState):
+        """Persist the profile, flow state and prompt memory."""
+        conn = self._connect()
+        with conn:
+            self._write_state(conn, session)
+
+    def _write_state(self, conn: sqlite3.Connection, session: SessionState):
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions "
+            "(session_id, profile, conversation_state, pending_questions, memory, message_count, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                session.session_id,
+                json.dumps(session.user_profile),
+                session.conversation_state,
+                json.dumps(session.pending_questions),
+                json.dumps(session.memory.to_dict()),
+                session.message_count,
+                time.time(),
+            ),
+        )
+
+    def clear(self, session: SessionState):
+        """Reset the session and delete its stored messages."""
+        session.reset()
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session.session_id,))
+            self._write_state(conn, session)
+
+    def evict(self) -> int:
+        """Drop idle sessions and the least recently used ones beyond max_hot from memory."""
+        cutoff = time.time() - self.idle_seconds
+        evicted = 0
+        with self._lock:
+            while self._hot:
+                session_id, (session, last_used) = next(iter(self._hot.items()))
+                if len(self._hot) <= self.max_hot and last_used >= cutoff:
+                    break
+                del self._hot[session_id]
+                evicted += 1
+        return evicted
+
+    def hot_count(self) -> int:
+        with self._lock:
+            return len(self._hot)
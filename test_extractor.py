@@ -0,0 +1,32 @@
+import pytest
+
+from extractor import PROFILE_EXTRACTOR
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("My balance is 3,50,000, and basic wage 45k", {"current_balance": 350000.0, "basic_wage": 45000.0}),
+    ("balance: Rs. 500000.", {"current_balance": 500000.0}),
+    ("basic salary is ₹40,000", {"basic_wage": 40000.0}),
+    ("corpus of 12 lakhs", {"current_balance": 1200000.0}),
+])
+def test_amounts_directly_after_a_cue_are_read(message, expected):
+    assert PROFILE_EXTRACTOR.extract(message) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "My PF balance as of March 2024 is 6 lakh",
+    "basic question: is it 50%?",
+    "salary was revised in 2019",
+    "my basic is 30%",
+    "balance 2020",
+])
+def test_years_percentages_and_distant_numbers_are_not_amounts(message):
+    fields = PROFILE_EXTRACTOR.extract(message)
+    assert "current_balance" not in fields
+    assert "basic_wage" not in fields
+
+
+def test_amounts_do_not_disturb_the_other_fields():
+    fields = PROFILE_EXTRACTOR.extract("Yes, still contributing, 10 years, for a home loan; my basic pay is 25000")
+    assert fields == {"pf_contribution": "active", "service_years": 10,
+                      "withdrawal_type": "home_loan_repayment", "basic_wage": 25000.0}
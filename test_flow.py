@@ -0,0 +1,95 @@
+import pytest
+
+from Work import INTAKE_QUESTIONS, PFBot, PFEngine
+from backends import StubBackend
+from cache import ResponseCache
+from metrics import MetricsRegistry
+
+
+class CountingBackend(StubBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def generate_content(self, *args, **kwargs):
+        self.calls += 1
+        return super().generate_content(*args, **kwargs)
+
+
+def _bot(rephrase_rule_answers: bool = False) -> PFBot:
+    backend = CountingBackend()
+    engine = PFEngine(backend=backend, cache=ResponseCache(), metrics=MetricsRegistry(),
+                      rephrase_rule_answers=rephrase_rule_answers)
+    return PFBot(engine=engine)
+
+
+def test_bare_answers_to_pending_questions_are_answered_from_templates():
+    bot = _bot()
+    bot.get_response("Hi, I want to take money out of my PF")
+    assert bot.backend.calls == 1
+    assert bot.pending_questions[0] == INTAKE_QUESTIONS["pf_contribution"]
+
+    assert bot.get_response("Yes").startswith("Thanks!")
+    assert bot.get_response("7").startswith("Thanks!")
+    assert bot.user_profile["pf_contribution"] == "active"
+    assert bot.user_profile["service_years"] == 7
+    assert bot.backend.calls == 1
+
+
+def test_required_fields_get_the_verdict_without_the_optional_question():
+    bot = _bot()
+    bot.get_response("Yes, I'm still employed and contributing")
+    bot.get_response("I have 12 years of service")
+    answer = bot.get_response("It's for my home loan")
+    assert answer.startswith("Good news")
+    assert bot.conversation_state == "complete"
+    assert bot.backend.calls == 0
+
+
+@pytest.mark.parametrize("reply", ["not sure", "no idea", "No clue really"])
+def test_hedged_replies_are_not_read_as_no(reply):
+    bot = _bot()
+    bot.get_response("Hi, I want to take money out of my PF")
+    bot.get_response(reply)
+    assert bot.user_profile["pf_contribution"] is None
+
+
+@pytest.mark.parametrize("reply", ["No", "Nope.", "No, I left my job"])
+def test_bare_no_answers_the_employment_question(reply):
+    bot = _bot()
+    bot.get_response("Hi, I want to take money out of my PF")
+    bot.get_response(reply)
+    assert bot.user_profile["pf_contribution"] == "inactive"
+
+
+def test_category_in_the_previous_withdrawals_reply_keeps_the_current_purpose():
+    bot = _bot(rephrase_rule_answers=True)
+    bot.get_response("Yes, I'm still employed and contributing")
+    bot.get_response("I have 12 years of service")
+    assert bot.get_response("It's for my home loan").endswith(INTAKE_QUESTIONS["previous_withdrawals"])
+    assert bot.conversation_state == "confirming"
+
+    bot.get_response("Yes, once for medical")
+    assert bot.user_profile["withdrawal_type"] == "home_loan_repayment"
+    assert bot.user_profile["previous_withdrawals"] == "yes"
+    assert bot.conversation_state == "complete"
+
+
+def test_spreadsheet_values_in_batch_answers_are_read():
+    bot = _bot()
+    answer = bot.get_personalized_withdrawal_advice(
+        {"pf_contribution": "Yes, still contributing", "service_years": 10,
+         "withdrawal_type": "home loan", "previous_withdrawals": True},
+        raise_errors=True,
+    )
+    assert answer.startswith("Good news")
+    assert bot.user_profile["service_years"] == 10
+    assert bot.user_profile["previous_withdrawals"] == "yes"
+
+    bot = _bot()
+    bot.get_personalized_withdrawal_advice(
+        {"service_years": "12", "withdrawal_type": "medical", "previous_withdrawals": False},
+        raise_errors=True,
+    )
+    assert bot.user_profile["service_years"] == 12
+    assert bot.user_profile["previous_withdrawals"] == "none"
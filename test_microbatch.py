@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+
+from metrics import MetricsRegistry
+from microbatch import MicroBatcher, parse_batch_answers
+
+
+def _batcher(batches, window=0.2):
+    def run_batch(items):
+        batches.append([item for _, item in items])
+        return {request_id: f"batched {item}" for request_id, item in items}
+
+    return MicroBatcher(run_batch, lambda item: f"single {item}", window=window, max_size=8,
+                        metrics=MetricsRegistry())
+
+
+def test_cancelled_waiter_does_not_strand_the_rest_of_its_batch():
+    batches = []
+    batcher = _batcher(batches)
+    results = {}
+
+    def sync_caller(name):
+        results[name] = batcher.submit(name).result(5)
+
+    async def async_caller():
+        # Times out and cancels its future while the batch is still filling
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(batcher.submit("async")), 0.05)
+        except asyncio.TimeoutError:
+            results["async"] = "timed out"
+
+    threads = [threading.Thread(target=sync_caller, args=(f"sync{i}",)) for i in range(3)]
+    async_thread = threading.Thread(target=asyncio.run, args=(async_caller(),))
+    async_thread.start()
+    time.sleep(0.01)
+    for thread in threads:
+        thread.start()
+    for thread in threads + [async_thread]:
+        thread.join(5)
+
+    assert results == {"async": "timed out", "sync0": "batched sync0",
+                       "sync1": "batched sync1", "sync2": "batched sync2"}
+    assert [sorted(batch) for batch in batches] == [["sync0", "sync1", "sync2"]]
+
+
+def test_entries_missing_from_the_reply_fall_back_to_single_calls():
+    batcher = MicroBatcher(lambda items: {items[0][0]: "batched"}, lambda item: f"single {item}",
+                           window=0.1, metrics=MetricsRegistry())
+    futures = [batcher.submit(name) for name in ("a", "b", "c")]
+    assert [future.result(5) for future in futures] == ["batched", "single b", "single c"]
+
+
+def test_parse_batch_answers_accepts_fenced_json_and_drops_unknown_ids():
+    text = '```json\n[{"id": "0", "answer": " yes "}, {"id": "9", "answer": "x"}, {"id": "1", "answer": ""}]\n```'
+    assert parse_batch_answers(text, ["0", "1"]) == {"0": "yes"}
+    assert parse_batch_answers("no json here", ["0"]) == {}
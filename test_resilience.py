@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from metrics import MetricsRegistry
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, is_retryable
+
+
+class Overloaded(Exception):
+    code = 503
+
+
+def _caller(**kwargs) -> ResilientCaller:
+    kwargs.setdefault("backoff", 0.001)
+    return ResilientCaller(metrics=MetricsRegistry(), **kwargs)
+
+
+def test_is_retryable_by_type_name_and_status_code():
+    assert is_retryable(TimeoutError())
+    assert is_retryable(Overloaded())
+    assert not is_retryable(ValueError("bad request"))
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through_after_reset():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # only one trial call at a time
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_call_retries_retryable_errors_then_succeeds():
+    caller = _caller(retries=2)
+    attempts = []
+
+    def fn(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise Overloaded()
+        return "ok"
+
+    assert caller.call(fn) == "ok"
+    assert len(attempts) == 3
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_call_does_not_retry_or_trip_the_breaker_on_a_bad_request():
+    caller = _caller(breaker=CircuitBreaker(failure_threshold=1), retries=3)
+    attempts = []
+
+    def fn(timeout):
+        attempts.append(timeout)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        caller.call(fn)
+    assert len(attempts) == 1
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_fails_fast():
+    caller = _caller(breaker=CircuitBreaker(failure_threshold=1, reset_seconds=60), retries=0)
+    with pytest.raises(Overloaded):
+        caller.call(lambda timeout: (_ for _ in ()).throw(Overloaded()))
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda timeout: "never called")
+
+
+def test_concurrent_calls_with_the_same_key_share_one_run():
+    caller = _caller()
+    runs = []
+
+    def fn(timeout):
+        runs.append(1)
+        time.sleep(0.05)
+        return "shared"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(caller.call(fn, key="k"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["shared"] * 5
+    assert len(runs) == 1
+
+
+def test_waiting_for_a_local_slot_does_not_count_against_the_attempt_deadline():
+    # Healthy upstream, but far more callers than slots: the queueing must not look like
+    # upstream timeouts, or it would be retried and would open the breaker
+    caller = _caller(breaker=CircuitBreaker(failure_threshold=2), attempt_timeout=0.1)
+
+    async def fn(timeout):
+        await asyncio.sleep(0.03)
+        return "ok"
+
+    async def main():
+        limiter = asyncio.Semaphore(2)
+        return await asyncio.gather(*[caller.call_async(fn, timeout=5, limiter=limiter) for _ in range(20)])
+
+    assert asyncio.run(main()) == ["ok"] * 20
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_running_out_of_time_in_the_slot_queue_is_not_an_upstream_failure():
+    caller = _caller(breaker=CircuitBreaker(failure_threshold=1))
+
+    async def fn(timeout):
+        await asyncio.sleep(0.2)
+        return "ok"
+
+    async def main():
+        limiter = asyncio.Semaphore(1)
+        slow = asyncio.ensure_future(caller.call_async(fn, limiter=limiter))
+        await asyncio.sleep(0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await caller.call_async(fn, timeout=0.05, limiter=limiter)
+        return await slow
+
+    assert asyncio.run(main()) == "ok"
+    assert caller.breaker.state == CircuitBreaker.CLOSED